@@ -0,0 +1 @@
+default_app_config = 'paiji2_social.apps.Paiji2SocialConfig'
@@ -1,9 +1,16 @@
 from django.contrib import admin
 
 from . import models
+from .pagination import EstimatedCountPaginator
 
 
-class GroupAdmin(admin.ModelAdmin):
+class LargeTableAdmin(admin.ModelAdmin):
+    """ Changelists of tables too large to be counted on every page """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class GroupAdmin(LargeTableAdmin):
     list_display = (
         'name',
         'category',
@@ -12,6 +19,7 @@ class GroupAdmin(admin.ModelAdmin):
         'logo',
         'newsfeed',
     )
+    list_select_related = ('category', )
 
 
 class BureauAdmin(admin.ModelAdmin):
@@ -20,10 +28,11 @@ class BureauAdmin(admin.ModelAdmin):
         'createdDate',
         'endDate',
     )
+    list_select_related = ('group', )
     ordering = ('-createdDate', )
 
 
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(LargeTableAdmin):
     list_display = (
         'author',
         'group',
@@ -32,17 +41,26 @@ class MessageAdmin(admin.ModelAdmin):
         'pubDate',
         'importance',
     )
+    list_select_related = ('author', 'group', )
+    list_filter = ('pubDate', 'public', )
+    date_hierarchy = 'pubDate'
+    raw_id_fields = ('author', )
     ordering = ('-pubDate', )
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = (
         'message',
         'author',
         'pubDate',
         'content',
     )
-    ordering = ('message', '-pubDate', )
+    list_select_related = ('message', 'author', )
+    list_filter = ('pubDate', )
+    date_hierarchy = 'pubDate'
+    raw_id_fields = ('message', 'author', )
+    # the message order would join the messages to sort the comments
+    ordering = ('-pubDate', )
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -51,6 +69,8 @@ class PostAdmin(admin.ModelAdmin):
         'utilisateur',
         'postType',
     )
+    list_select_related = ('bureau__group', 'utilisateur', 'postType', )
+    raw_id_fields = ('utilisateur', )
 
 
 admin.site.register(models.PostType)
@@ -0,0 +1,11 @@
+from importlib import import_module
+
+from django.apps import AppConfig
+
+
+class Paiji2SocialConfig(AppConfig):
+    name = 'paiji2_social'
+
+    def ready(self):
+        # connects the signal receivers
+        import_module('.signals', self.name)
@@ -0,0 +1,250 @@
+# -*- encoding: utf-8 -*-
+"""
+Synthetic dataset and measures of the pages of paiji2_social, used by the
+benchmark command.
+"""
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from backbone_calendar.models import Calendar
+
+from .counters import recompute_comment_counters
+from .models import (
+    Bureau, Comment, Group, GroupCategory, Message, Post, PostType,
+)
+from .sanitizer import sanitize, get_excerpt
+from .search import get_search_backend
+from . import timeline, urls
+
+
+USERNAME = 'benchmark-%d'
+PASSWORD = 'benchmark'
+BATCH_SIZE = 1000
+
+# routes only answering POST requests
+POST_ROUTES = set(['comment-add', 'comment-api'])
+QUERY_STRINGS = {
+    'directory': {'q': 'benchmark'},
+    'directory-suggest': {'q': 'bench'},
+}
+
+CONTENT = (
+    u'<p>Message {i} of the <strong>benchmark</strong>, about '
+    u'<a href="http://example.com/{i}">the news</a> of the group.</p>'
+)
+
+
+def batches(objects):
+    for start in range(0, len(objects), BATCH_SIZE):
+        yield objects[start:start + BATCH_SIZE]
+
+
+def bulk_ids(model, objects, **filters):
+    """
+    Inserts the objects and returns their ids, bulk_create does not set
+    them.
+    """
+    for batch in batches(objects):
+        model.objects.bulk_create(batch)
+    return list(model.objects.filter(**filters).order_by(
+        'pk',
+    ).values_list('pk', flat=True))
+
+
+@transaction.atomic
+def seed(nb_users=2000, nb_groups=200, nb_messages=100000,
+         nb_comments=100000, nb_post_types=8, random_seed=0):
+    """
+    Fills the database with users, groups and their current bureau, and
+    messages and comments spread over the groups. Only the first user
+    has a password (see PASSWORD).
+
+    The receivers are not run by the bulk inserts: the denormalized fields
+    are computed here. The publication dates of the messages are set on
+    insert by auto_now_add, in insertion order.
+    """
+    rand = random.Random(random_seed)
+    now = timezone.now()
+    User = get_user_model()
+
+    User.objects.bulk_create([
+        User(
+            username=USERNAME % i,
+            first_name=u'First%d' % i,
+            last_name=u'Last%d' % i,
+            email=u'benchmark%d@example.com' % i,
+            password=make_password(PASSWORD if i == 0 else None),
+        ) for i in range(nb_users)
+    ], batch_size=BATCH_SIZE)
+    user_ids = list(User.objects.filter(
+        username__startswith='benchmark-',
+    ).order_by('pk').values_list('pk', flat=True))
+
+    post_type_ids = bulk_ids(PostType, [
+        PostType(description=u'benchmark %d' % i)
+        for i in range(nb_post_types)
+    ], description__startswith=u'benchmark ')
+    category_ids = bulk_ids(GroupCategory, [
+        GroupCategory(name=u'benchmark %d' % i) for i in range(10)
+    ], name__startswith=u'benchmark ')
+    calendar_ids = bulk_ids(Calendar, [
+        Calendar(name=u'benchmark %d' % i, slug=u'benchmark-%d' % i)
+        for i in range(nb_groups)
+    ], name__startswith=u'benchmark ')
+    group_ids = bulk_ids(Group, [
+        Group(
+            name=u'benchmark %d' % i,
+            slug=u'benchmark-%d' % i,
+            category_id=category_ids[i % len(category_ids)],
+            logo=u'groups/logo/benchmark.png',
+            calendar_id=calendar_ids[i],
+        ) for i in range(nb_groups)
+    ], name__startswith=u'benchmark ')
+    bureau_ids = bulk_ids(Bureau, [
+        Bureau(group_id=group_id) for group_id in group_ids
+    ], group__in=group_ids)
+
+    # the first user is in the first bureau only
+    members = {}
+    posts = []
+    for bureau_id, group_id in zip(bureau_ids, group_ids):
+        members[group_id] = [] if posts else [user_ids[0]]
+        members[group_id] += rand.sample(user_ids[1:], min(
+            nb_post_types - len(members[group_id]),
+            len(user_ids) - 1,
+        ))
+        posts.extend(
+            Post(utilisateur_id=user_id, bureau_id=bureau_id,
+                 postType_id=post_type_id)
+            for user_id, post_type_id in zip(members[group_id], post_type_ids)
+        )
+    for batch in batches(posts):
+        Post.objects.bulk_create(batch)
+
+    messages = []
+    for i in range(nb_messages):
+        # the first message is one of the first user
+        group_id = rand.choice(group_ids) if i else group_ids[0]
+        html, text = sanitize(CONTENT.format(i=i))
+        messages.append(Message(
+            author_id=rand.choice(members[group_id]) if i else user_ids[0],
+            group_id=group_id,
+            title=u'Benchmark message %d' % i,
+            content=CONTENT.format(i=i),
+            contentHtml=html,
+            excerpt=get_excerpt(text),
+            public=bool(i % 2),
+            lastActivity=now,
+        ))
+    message_ids = bulk_ids(Message, messages, group__in=group_ids)
+
+    for batch in batches(range(nb_comments)):
+        Comment.objects.bulk_create([
+            Comment(
+                author_id=rand.choice(user_ids),
+                message_id=rand.choice(message_ids),
+                pubDate=now + timedelta(microseconds=i),
+                content=u'Benchmark comment %d' % i,
+            ) for i in batch
+        ])
+    recompute_comment_counters(connection, Message, Comment)
+
+    backend = get_search_backend()
+    for user in User.objects.filter(pk__in=user_ids).iterator():
+        backend.index_user(user)
+    if timeline.is_enabled():
+        timeline.rebuild()
+
+
+def get_routes():
+    """ The names and the keyword arguments of the routes """
+    user = get_user_model().objects.get(username=USERNAME % 0)
+    message = Message.objects.filter(author=user).first()
+    values = {
+        'slug': message.group.slug,
+        'pk': message.pk,
+        'on_message': message.pk,
+        'format': 'csv',
+    }
+    routes = []
+    for pattern in urls.urlpatterns:
+        if pattern.name in POST_ROUTES:
+            continue
+        routes.append((pattern.name, dict(
+            (name, values[name]) for name in pattern.regex.groupindex
+        )))
+    return routes
+
+
+def measure(client, url, data=None, repeat=3):
+    """
+    Requests the url with an empty cache and returns the status code, the
+    number of queries and the median SQL and wall times, in milliseconds.
+    """
+    runs = []
+    for i in range(repeat):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            response = client.get(url, data or {})
+            # the streamed bodies are built, and query, while iterated
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    pass
+            wall_time = time.time() - start
+        runs.append((
+            sum(float(query['time']) for query in queries) * 1000,
+            wall_time * 1000,
+            len(queries),
+        ))
+    sql_times, wall_times, nb_queries = zip(*runs)
+    return {
+        'status': response.status_code,
+        'queries': max(nb_queries),
+        'sql_time': sorted(sql_times)[len(runs) // 2],
+        'wall_time': sorted(wall_times)[len(runs) // 2],
+    }
+
+
+def run(client, repeat=3):
+    """ Measures every route, as the first user of the dataset """
+    client.login(username=USERNAME % 0, password=PASSWORD)
+    return dict(
+        (name, measure(
+            client,
+            reverse(name, kwargs=kwargs),
+            QUERY_STRINGS.get(name),
+            repeat,
+        )) for name, kwargs in get_routes()
+    )
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Lists the routes running more queries than in the baseline, or
+    slower by more than the tolerance.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result['queries'] > reference['queries']:
+            regressions.append(u'%s: %d queries instead of %d' % (
+                name, result['queries'], reference['queries'],
+            ))
+        for key in ('sql_time', 'wall_time'):
+            if result[key] > reference[key] * (1 + tolerance):
+                regressions.append(u'%s: %s of %.1fms instead of %.1fms' % (
+                    name, key, result[key], reference[key],
+                ))
+    return regressions
@@ -0,0 +1,117 @@
+# -*- encoding: utf-8 -*-
+"""
+Query budgets of the pages, by URL name. A budget counts every query of
+the request, the session and user lookups included.
+"""
+import logging
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+from .instrumentation import QueryLog
+
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+DEFAULT_QUERY_BUDGETS = {
+    'index': 8,
+    'newsfeed-mine': 8,
+    'newsfeed-add': 7,
+    'newsfeed-edit': 8,
+    'newsfeed-delete': 4,
+    'comment-add': 6,
+    'comment-api': 6,
+    'directory': 6,
+    'directory-suggest': 3,
+    'groups': 5,
+    'workgroup-view': 6,
+    'workgroup-members': 6,
+    'workgroup-news': 9,
+    'feed-latest': 5,
+    'feed-latest-atom': 5,
+    'workgroup-feed': 6,
+    'workgroup-feed-atom': 6,
+}
+
+# the values of the queries, to group the queries differing by them only
+VALUES_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def get_query_budgets():
+    budgets = dict(DEFAULT_QUERY_BUDGETS)
+    budgets.update(getattr(settings, 'PAIJI2_SOCIAL_QUERY_BUDGETS', {}))
+    return budgets
+
+
+def get_duplicates(queries):
+    """ The queries run more than once, whatever their values, and counts """
+    counter = Counter(VALUES_RE.sub('?', query['sql']) for query in queries)
+    return [(sql, nb) for sql, nb in counter.most_common() if nb > 1]
+
+
+def check_budget(url_name, queries, fail=True):
+    """
+    Raises QueryBudgetExceeded, or logs a warning, when the queries of a
+    request exceed the budget of its URL name.
+    """
+    budget = get_query_budgets().get(url_name)
+    if budget is None or len(queries) <= budget:
+        return
+    message = '%s ran %d queries, its budget is %d' % (
+        url_name, len(queries), budget,
+    )
+    duplicates = get_duplicates(queries)
+    if duplicates:
+        message += '\nDuplicated queries:\n' + '\n'.join(
+            '%d x %s' % (nb, sql) for sql, nb in duplicates
+        )
+    if fail:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class QueryBudgetMiddleware(object):
+    """
+    Checks the query budgets of the requests, to put first in
+    MIDDLEWARE_CLASSES for the tests or a staging server. It raises when
+    PAIJI2_SOCIAL_QUERY_BUDGETS_FAIL is set, and logs a warning otherwise.
+    """
+
+    def process_request(self, request):
+        # the log of a request whose response was not processed
+        self.stop_log()
+        _state.queries = QueryLog()
+
+    def stop_log(self):
+        queries = getattr(_state, 'queries', None)
+        _state.queries = None
+        if queries is not None:
+            return queries.stop()
+
+    def process_exception(self, request, exception):
+        # the response middlewares may not run, the queries are still
+        # checked by process_response when they do
+        queries = getattr(_state, 'queries', None)
+        if queries is not None:
+            queries.stop()
+
+    def process_response(self, request, response):
+        queries = self.stop_log()
+        if queries is None:
+            return response
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is not None:
+            check_budget(
+                resolver_match.url_name,
+                queries,
+                getattr(settings, 'PAIJI2_SOCIAL_QUERY_BUDGETS_FAIL', False),
+            )
+        return response
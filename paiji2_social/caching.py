@@ -0,0 +1,113 @@
+# -*- encoding: utf-8 -*-
+import hashlib
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.middleware.csrf import get_token
+from django.utils import timezone, translation
+from django.utils.dateparse import parse_datetime
+
+from .models import Message, Comment
+
+
+NEWS_MARKER_KEY = 'paiji2_social:news-marker'
+
+
+def get_news_marker():
+    """
+    Returns the time of the last change of a message or a comment. It is
+    part of every cached piece of news, so bumping it invalidates them.
+    """
+    marker = cache.get(NEWS_MARKER_KEY)
+    if marker is None:
+        marker = bump_news_marker()
+    return marker
+
+
+def bump_news_marker():
+    marker = time.time()
+    cache.set(NEWS_MARKER_KEY, marker, None)
+    return marker
+
+
+def get_news_cache_timeout():
+    return getattr(settings, 'PAIJI2_SOCIAL_NEWS_CACHE_TIMEOUT', 300)
+
+
+def get_audience(user):
+    return 'authenticated' if user.is_authenticated() else 'public'
+
+
+def news_feed_cache_key(request):
+    """
+    Key of the rendered news feed for the audience, language and page
+    asked
+    """
+    page = hashlib.md5(u'|'.join(
+        request.GET.get(param, u'')
+        for param in ('page', 'before', 'after', 'sort')
+    ).encode('utf-8')).hexdigest()
+    return 'paiji2_social:news-feed:%s:%s:%s:%r' % (
+        get_audience(request.user),
+        translation.get_language(),
+        page,
+        get_news_marker(),
+    )
+
+
+def get_news_state(request):
+    """
+    Latest publication date and latest id of the messages and of the
+    comments, read with a single query and kept on the request. Both are
+    read from the ends of indexes, whatever the size of the tables.
+    """
+    if not hasattr(request, '_news_state'):
+        qn = connection.ops.quote_name
+        columns = []
+        for model in (Message, Comment):
+            table = qn(model._meta.db_table)
+            for field in ('pubDate', 'id'):
+                columns.append('(SELECT MAX(%s) FROM %s)' % (
+                    qn(model._meta.get_field(field).column),
+                    table,
+                ))
+        cursor = connection.cursor()
+        cursor.execute('SELECT ' + ', '.join(columns))
+        request._news_state = cursor.fetchone()
+    return request._news_state
+
+
+def news_etag(request, *args, **kwargs):
+    """
+    ETag of the news pages: they change with the messages and comments
+    (the marker also catches edits and deletions), the visitor, their
+    CSRF token held by the comment forms, the language and the page
+    asked.
+    """
+    return hashlib.md5((u'%r|%r|%s|%s|%s|%s' % (
+        get_news_state(request),
+        get_news_marker(),
+        request.user.pk,
+        get_token(request),
+        translation.get_language(),
+        request.get_full_path(),
+    )).encode('utf-8')).hexdigest()
+
+
+def news_last_modified(request, *args, **kwargs):
+    """
+    Latest publication of a message or a comment, or later change of the
+    news marker, as the edits and the deletions publish nothing.
+    """
+    dates = [datetime.utcfromtimestamp(get_news_marker())]
+    for date in get_news_state(request)[::2]:
+        if isinstance(date, basestring):
+            date = parse_datetime(date)
+        if date is not None:
+            if timezone.is_aware(date):
+                date = timezone.make_naive(date, timezone.utc)
+            dates.append(date)
+    return max(dates)
@@ -0,0 +1,36 @@
+def recompute_comment_counters(connection, message_model, comment_model):
+    """
+    Recomputes Message.commentCount and Message.lastActivity of every
+    message from the comments, in a single statement.
+    """
+    qn = connection.ops.quote_name
+    message = qn(message_model._meta.db_table)
+    comment = qn(comment_model._meta.db_table)
+    comment_of_message = '%s.%s = %s.%s' % (
+        comment,
+        qn(comment_model._meta.get_field('message').column),
+        message,
+        qn(message_model._meta.pk.column),
+    )
+    comment_date = qn(comment_model._meta.get_field('pubDate').column)
+    cursor = connection.cursor()
+    cursor.execute(
+        'UPDATE %(message)s SET '
+        '%(count)s = (SELECT COUNT(*) FROM %(comment)s WHERE %(join)s), '
+        '%(activity)s = COALESCE('
+        '(SELECT MAX(%(comment)s.%(comment_date)s) FROM %(comment)s '
+        'WHERE %(join)s), %(message)s.%(message_date)s)' % {
+            'message': message,
+            'comment': comment,
+            'join': comment_of_message,
+            'count': qn(message_model._meta.get_field('commentCount').column),
+            'activity': qn(
+                message_model._meta.get_field('lastActivity').column
+            ),
+            'comment_date': comment_date,
+            'message_date': qn(
+                message_model._meta.get_field('pubDate').column
+            ),
+        }
+    )
+    return cursor.rowcount
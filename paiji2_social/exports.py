@@ -0,0 +1,81 @@
+# -*- encoding: utf-8 -*-
+import csv
+
+from django.conf import settings
+from django.utils.encoding import force_text
+
+
+def iterate_in_chunks(queryset, fields, chunk_size=None):
+    """
+    Yields the values of the fields of the rows of the queryset, read by
+    ranges of primary keys: a single chunk is in memory at once, whatever
+    the number of rows.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'PAIJI2_SOCIAL_EXPORT_CHUNK_SIZE', 500)
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        rows = list(chunk.values('pk', *fields)[:chunk_size])
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1]['pk']
+
+
+class Echo(object):
+    """ A file whose writes return the written line, for csv.writer """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, columns):
+    """
+    CSV lines of the rows, ``columns`` being (field, header) pairs. The
+    first line is the header.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow([
+        force_text(header).encode('utf-8') for field, header in columns
+    ])
+    for row in rows:
+        yield writer.writerow([
+            force_text(row[field] or '').encode('utf-8')
+            for field, header in columns
+        ])
+
+
+def escape_vcard(value):
+    return force_text(value or '').replace('\\', '\\\\').replace(
+        ',', '\\,',
+    ).replace(';', '\\;').replace('\n', '\\n')
+
+
+def vcards(rows, title_field=None):
+    """ vCards of the rows of users, with their username and email """
+    for row in rows:
+        first_name = escape_vcard(row['first_name'])
+        last_name = escape_vcard(row['last_name'])
+        lines = [
+            u'BEGIN:VCARD',
+            u'VERSION:3.0',
+            u'N:%s;%s;;;' % (last_name, first_name),
+            u'FN:%s' % (
+                u' '.join(name for name in (first_name, last_name) if name) or
+                escape_vcard(row['username'])
+            ),
+            u'NICKNAME:%s' % escape_vcard(row['username']),
+        ]
+        if row['email']:
+            lines.append(
+                u'EMAIL;TYPE=INTERNET:%s' % escape_vcard(row['email']),
+            )
+        if title_field is not None and row[title_field]:
+            lines.append(u'TITLE:%s' % escape_vcard(row[title_field]))
+        lines.append(u'END:VCARD')
+        yield (u'\r\n'.join(lines) + u'\r\n').encode('utf-8')
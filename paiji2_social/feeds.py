@@ -1,8 +1,22 @@
+from django.conf import settings
 from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.feedgenerator import Atom1Feed
 from django.utils.translation import ugettext as _
 from django.core.urlresolvers import reverse
 
-from .models import Message
+from .models import Message, Group
+from .caching import get_audience, get_news_marker, get_news_cache_timeout
+
+
+class FeedSource(object):
+    """ What a feed is built from: the reader and an optional group """
+
+    def __init__(self, user, group=None):
+        self.user = user
+        self.group = group
 
 
 class LatestEntriesFeed(Feed):
@@ -10,8 +24,42 @@ class LatestEntriesFeed(Feed):
     link = "/feeds/"
     description = _("Latest entries from all the workgroups")
 
-    def items(self):
-        return Message.objects.order_by('-pubDate')[:10]
+    def __call__(self, request, *args, **kwargs):
+        """
+        The serialized feed is built once after each change of the news and
+        stored in the cache, readers polling it get the stored bytes. Its
+        links are absolute, the host and the scheme are part of the key.
+        """
+        key = 'paiji2_social:feed:%s:%s:%s:%s:%s:%r' % (
+            self.__class__.__name__,
+            kwargs.get('slug', ''),
+            get_audience(request.user),
+            request.get_host(),
+            'https' if request.is_secure() else 'http',
+            get_news_marker(),
+        )
+        feed = cache.get(key)
+        if feed is None:
+            response = super(LatestEntriesFeed, self).__call__(
+                request, *args, **kwargs
+            )
+            feed = (response.content, response['Content-Type'])
+            cache.set(key, feed, get_news_cache_timeout())
+        content, content_type = feed
+        return HttpResponse(content, content_type=content_type)
+
+    def get_object(self, request, slug=None):
+        group = None
+        if slug is not None:
+            group = get_object_or_404(Group, slug=slug)
+        return FeedSource(request.user, group)
+
+    def items(self, obj):
+        qs = Message.objects.visible_to(obj.user)
+        if obj.group is not None:
+            qs = qs.filter(group=obj.group)
+        nb_items = getattr(settings, 'PAIJI2_SOCIAL_FEED_ITEMS', 10)
+        return qs.for_feed()[:nb_items]
 
     def item_title(self, item):
         return u'[{group}] {title}'.format(
@@ -20,7 +68,7 @@ class LatestEntriesFeed(Feed):
         )
 
     def item_description(self, item):
-        return item.content
+        return item.contentHtml
 
     def item_link(self, item):
         return reverse('index')
@@ -30,3 +78,30 @@ class LatestEntriesFeed(Feed):
 
     def item_pubdate(self, item):
         return item.pubDate
+
+
+class LatestEntriesAtomFeed(LatestEntriesFeed):
+    feed_type = Atom1Feed
+    subtitle = LatestEntriesFeed.description
+
+
+class GroupEntriesFeed(LatestEntriesFeed):
+
+    def title(self, obj):
+        return _('%(group)s Latest Entries') % {'group': obj.group}
+
+    def link(self, obj):
+        return reverse('workgroup-news', kwargs={'slug': obj.group.slug})
+
+    def description(self, obj):
+        return _('Latest entries from %(group)s') % {'group': obj.group}
+
+    def item_link(self, item):
+        return reverse('workgroup-news', kwargs={'slug': item.group.slug})
+
+
+class GroupEntriesAtomFeed(GroupEntriesFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
@@ -0,0 +1,106 @@
+# -*- encoding: utf-8 -*-
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+# derivatives of the group logos, by name: (width, height) box
+LOGO_DERIVATIVES = {
+    # news feed messages
+    'icon': (128, 128),
+    # group directory
+    'thumbnail': (100, 100),
+}
+
+
+def get_derivative_name(name, size):
+    """ The derivatives are stored next to the original image """
+    root, ext = os.path.splitext(name)
+    return '%s.%s.png' % (root, size)
+
+
+def get_derivatives_signature(name):
+    """
+    What Group.logoDerivativesOf holds once the derivatives of the logo
+    ``name`` are generated: the logo and the sizes they were made for.
+    """
+    return '%s|%s' % (name, ','.join(
+        '%s:%dx%d' % (size, box[0], box[1])
+        for size, box in sorted(LOGO_DERIVATIVES.items())
+    ))
+
+
+def render_derivative(field_file, box):
+    field_file.open('rb')
+    try:
+        image = Image.open(field_file)
+        image.load()
+    finally:
+        field_file.close()
+    image = image.convert('RGBA')
+    image.thumbnail(box, Image.ANTIALIAS)
+    output = BytesIO()
+    image.save(output, 'PNG', optimize=True)
+    return ContentFile(output.getvalue())
+
+
+def delete_logo_derivatives(storage, signature):
+    """ Removes the files listed by a previous signature """
+    if '|' not in signature:
+        return
+    name, sizes = signature.rsplit('|', 1)
+    for size in sizes.split(','):
+        derivative = get_derivative_name(name, size.split(':')[0])
+        if storage.exists(derivative):
+            storage.delete(derivative)
+
+
+def generate_logo_derivatives(group, force=False):
+    """
+    Writes the derivatives of the logo of the group, unless they were
+    already generated for this logo and these sizes. Returns whether it
+    did.
+    """
+    logo = group.logo
+    if not logo:
+        return False
+    signature = get_derivatives_signature(logo.name)
+    if group.logoDerivativesOf == signature and not force:
+        return False
+
+    try:
+        if group.logoDerivativesOf:
+            delete_logo_derivatives(logo.storage, group.logoDerivativesOf)
+        for size, box in LOGO_DERIVATIVES.items():
+            name = get_derivative_name(logo.name, size)
+            if logo.storage.exists(name):
+                logo.storage.delete(name)
+            logo.storage.save(name, render_derivative(logo, box))
+    except IOError:
+        logger.warning('Cannot resize the logo %s', logo.name, exc_info=True)
+        return False
+
+    group.__class__.objects.filter(pk=group.pk).update(
+        logoDerivativesOf=signature,
+    )
+    group.logoDerivativesOf = signature
+    return True
+
+
+def get_logo_url(group, size):
+    """
+    URL of a derivative of the logo of the group, or of the logo itself
+    while it has none, None for a group without logo. Only the storage
+    naming is used, not its files.
+    """
+    logo = group.logo
+    if not logo:
+        return None
+    if group.logoDerivativesOf == get_derivatives_signature(logo.name):
+        return logo.storage.url(get_derivative_name(logo.name, size))
+    return logo.url
@@ -0,0 +1,244 @@
+# -*- encoding: utf-8 -*-
+"""
+Sampled measures of the requests: queries, SQL, render and template tag
+times per URL name, sent to the ``paiji2_social.instrumentation`` logger
+and kept in process-local rolling histograms.
+
+Enabled by adding InstrumentationMiddleware to MIDDLEWARE_CLASSES.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import get_library, InvalidTemplateLibrary
+from django.utils.decorators import available_attrs
+
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def get_sample_rate():
+    return getattr(settings, 'PAIJI2_SOCIAL_INSTRUMENTATION_SAMPLE_RATE', 0.01)
+
+
+def get_tag_libraries():
+    """ Template tag libraries whose tags are timed """
+    return getattr(
+        settings,
+        'PAIJI2_SOCIAL_INSTRUMENTATION_TAG_LIBRARIES',
+        ('comments', 'profile', 'gravatar'),
+    )
+
+
+class RollingHistogram(object):
+    """ The last values of a measure, to read its recent percentiles """
+
+    def __init__(self, size=None):
+        if size is None:
+            size = getattr(
+                settings,
+                'PAIJI2_SOCIAL_INSTRUMENTATION_HISTOGRAM_SIZE',
+                1000,
+            )
+        self.values = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        with self.lock:
+            self.values.append(value)
+
+    def summary(self):
+        with self.lock:
+            values = sorted(self.values)
+        if not values:
+            return {'count': 0}
+        return {
+            'count': len(values),
+            'p50': values[len(values) // 2],
+            'p95': values[min(len(values) - 1, len(values) * 95 // 100)],
+            'max': values[-1],
+        }
+
+
+def get_histogram(url_name, measure):
+    key = (url_name, measure)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(key, RollingHistogram())
+    return histogram
+
+
+def get_summary():
+    """ Percentiles of every measure, by URL name """
+    summary = {}
+    for (url_name, measure), histogram in list(_histograms.items()):
+        summary.setdefault(url_name, {})[measure] = histogram.summary()
+    return summary
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+class QueryLog(object):
+    """
+    The queries run on every connection from the creation of the log until
+    stop(), read from the query logs of the connections. Their debug
+    cursors are forced meanwhile and restored by stop(), which must be
+    called whatever happens to the request.
+    """
+
+    def __init__(self):
+        self.connections = []
+        self.queries = None
+        for connection in connections.all():
+            self.connections.append((
+                connection,
+                connection.force_debug_cursor,
+                len(connection.queries_log),
+            ))
+            connection.force_debug_cursor = True
+
+    def stop(self):
+        if self.queries is None:
+            self.queries = []
+            for connection, debug_cursor, start in self.connections:
+                connection.force_debug_cursor = debug_cursor
+                self.queries.extend(list(connection.queries_log)[start:])
+        return self.queries
+
+
+class Sample(object):
+    """ The measures of a sampled request """
+
+    def __init__(self):
+        self.start = time.time()
+        self.render_time = None
+        self.tags = {}
+        self.queries = QueryLog()
+
+    def add_tag_time(self, name, duration):
+        self.tags[name] = self.tags.get(name, 0) + duration
+
+    def finish(self, request, response):
+        queries = self.queries.stop()
+        resolver_match = getattr(request, 'resolver_match', None)
+        record = {
+            'url_name': resolver_match.url_name if resolver_match else None,
+            'method': request.method,
+            'status': response.status_code,
+            'time': (time.time() - self.start) * 1000,
+            'queries': len(queries),
+            'sql_time': sum(float(query['time']) * 1000 for query in queries),
+            'render_time': self.render_time,
+            'tags': self.tags,
+        }
+        return record
+
+
+def record(data):
+    logger.info(json.dumps(data, sort_keys=True), extra={
+        'instrumentation': data,
+    })
+    for measure in ('time', 'queries', 'sql_time', 'render_time'):
+        if data[measure] is not None:
+            get_histogram(data['url_name'], measure).add(data[measure])
+    for name, duration in data['tags'].items():
+        get_histogram(data['url_name'], 'tag:%s' % name).add(duration)
+
+
+def timed_node(name, render):
+    @wraps(render, assigned=available_attrs(render))
+    def _timed_render(context):
+        sample = getattr(_state, 'sample', None)
+        if sample is None:
+            return render(context)
+        start = time.time()
+        try:
+            return render(context)
+        finally:
+            sample.add_tag_time(name, (time.time() - start) * 1000)
+    return _timed_render
+
+
+def timed_tag(name, compile_function):
+    # the tags may be registered as functools.partial objects
+    @wraps(compile_function, assigned=available_attrs(compile_function))
+    def _compile(parser, token):
+        node = compile_function(parser, token)
+        node.render = timed_node(name, node.render)
+        return node
+    return _compile
+
+
+def instrument_library(library):
+    """ Times the rendering of the nodes of the tags of the library """
+    if getattr(library, 'paiji2_social_instrumented', False):
+        return
+    for name, compile_function in list(library.tags.items()):
+        library.tags[name] = timed_tag(name, compile_function)
+    library.paiji2_social_instrumented = True
+
+
+class InstrumentationMiddleware(object):
+    """
+    Measures a PAIJI2_SOCIAL_INSTRUMENTATION_SAMPLE_RATE share of the
+    requests. The other requests only cost a random number.
+    """
+
+    def __init__(self):
+        for name in get_tag_libraries():
+            try:
+                instrument_library(get_library(name))
+            except InvalidTemplateLibrary:
+                logger.warning('Unknown template tag library %s', name)
+
+    def process_request(self, request):
+        self.discard_sample()
+        if random.random() < get_sample_rate():
+            _state.sample = Sample()
+
+    def discard_sample(self):
+        """
+        Stops the sample of the thread, left by a request whose response
+        was not processed by this middleware.
+        """
+        sample = getattr(_state, 'sample', None)
+        _state.sample = None
+        if sample is not None:
+            sample.queries.stop()
+
+    def process_template_response(self, request, response):
+        sample = getattr(_state, 'sample', None)
+        if sample is not None and not response.is_rendered:
+            start = time.time()
+            response.render()
+            sample.render_time = (time.time() - start) * 1000
+        return response
+
+    def process_response(self, request, response):
+        sample = getattr(_state, 'sample', None)
+        if sample is not None:
+            _state.sample = None
+            record(sample.finish(request, response))
+        return response
+
+    def process_exception(self, request, exception):
+        # the response middlewares may not run, the sample is still
+        # recorded by process_response when they do
+        sample = getattr(_state, 'sample', None)
+        if sample is not None:
+            sample.queries.stop()
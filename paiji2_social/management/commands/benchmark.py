@@ -0,0 +1,95 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from ... import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the queries and the response times of the pages on a '
+        'synthetic dataset, in a test database'
+    )
+
+    option_list = BaseCommand.option_list + (
+        make_option('--users', type='int', default=2000),
+        make_option('--groups', type='int', default=200),
+        make_option('--messages', type='int', default=100000),
+        make_option('--comments', type='int', default=100000),
+        make_option(
+            '--repeat',
+            type='int',
+            default=3,
+            help='Number of requests per page, the median time is kept',
+        ),
+        make_option(
+            '--baseline',
+            default=None,
+            help='JSON file of the results the new ones are compared to',
+        ),
+        make_option(
+            '--save-baseline',
+            action='store_true',
+            default=False,
+            help='Writes the results to the baseline file',
+        ),
+        make_option(
+            '--tolerance',
+            type='float',
+            default=0.25,
+            help='Slowdown ratio reported as a regression',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0,
+            autoclobber=True,
+            serialize=False,
+        )
+        try:
+            benchmark.seed(
+                nb_users=options['users'],
+                nb_groups=options['groups'],
+                nb_messages=options['messages'],
+                nb_comments=options['comments'],
+            )
+            results = benchmark.run(Client(), options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write('%-24s %6s %8s %10s %10s' % (
+            'route', 'status', 'queries', 'sql (ms)', 'wall (ms)',
+        ))
+        for name, result in sorted(results.items()):
+            self.stdout.write('%-24s %6d %8d %10.1f %10.1f' % (
+                name,
+                result['status'],
+                result['queries'],
+                result['sql_time'],
+                result['wall_time'],
+            ))
+
+        baseline = options['baseline']
+        if baseline is None:
+            return
+        if options['save_baseline']:
+            with open(baseline, 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+            return
+        with open(baseline) as baseline_file:
+            regressions = benchmark.compare(
+                results,
+                json.load(baseline_file),
+                options['tolerance'],
+            )
+        if regressions:
+            raise CommandError('\n'.join(regressions))
+        self.stdout.write('No regression')
@@ -0,0 +1,36 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ... import writebehind
+
+
+class Command(BaseCommand):
+    help = 'Saves the messages and comments queued by the write-behind mode'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--batch-size',
+            type='int',
+            default=100,
+            help='Number of writes saved per transaction',
+        ),
+        make_option(
+            '--interval',
+            type='float',
+            default=None,
+            help='Keeps draining the queue, waiting as many seconds between '
+                 'two runs',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        while True:
+            nb_saved = writebehind.drain(options['batch_size'])
+            if options['interval'] is None:
+                break
+            if nb_saved:
+                self.stdout.write('%d writes saved' % nb_saved)
+            time.sleep(options['interval'])
+        self.stdout.write('%d writes saved' % nb_saved)
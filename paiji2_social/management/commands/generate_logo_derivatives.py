@@ -0,0 +1,26 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ...images import generate_logo_derivatives
+from ...models import Group
+
+
+class Command(BaseCommand):
+    help = 'Generates the missing derivatives of the group logos'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--force',
+            action='store_true',
+            default=False,
+            help='Generates the derivatives of every logo again',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        nb_groups = 0
+        for group in Group.objects.exclude(logo='').exclude(logo=None):
+            if generate_logo_derivatives(group, force=options['force']):
+                nb_groups += 1
+        self.stdout.write('%d logos resized' % nb_groups)
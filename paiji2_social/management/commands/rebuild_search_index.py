@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from ...search import get_search_backend, PostgresSearchBackend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the index of the user directory search'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        User = get_user_model()
+
+        if isinstance(backend, PostgresSearchBackend):
+            cursor = connection.cursor()
+            for sql in backend.get_index_sql(User):
+                cursor.execute(sql)
+            return
+
+        with transaction.atomic():
+            nb_users = 0
+            for user in User.objects.iterator():
+                backend.index_user(user)
+                nb_users += 1
+        self.stdout.write('%d users indexed' % nb_users)
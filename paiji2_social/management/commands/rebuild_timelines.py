@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ... import timeline
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the news timelines of the group members'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            nb_messages = timeline.rebuild()
+        self.stdout.write('%d messages dispatched' % nb_messages)
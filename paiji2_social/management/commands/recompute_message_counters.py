@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...counters import recompute_comment_counters
+from ...models import Message, Comment
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the comment counters of the messages'
+
+    def handle(self, *args, **options):
+        nb_messages = recompute_comment_counters(connection, Message, Comment)
+        self.stdout.write('%d messages updated' % nb_messages)
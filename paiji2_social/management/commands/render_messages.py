@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...sanitizer import render_messages
+from ...models import Message
+
+
+class Command(BaseCommand):
+    help = 'Computes the sanitized html and the excerpts of the messages'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            nb_messages = render_messages(Message)
+        self.stdout.write('%d messages rendered' % nb_messages)
@@ -0,0 +1,71 @@
+# -*- encoding: utf-8 -*-
+from django.conf import settings
+from django.core.cache import cache
+
+
+def get_cache_timeout():
+    return getattr(settings, 'PAIJI2_SOCIAL_MEMBERSHIP_CACHE_TIMEOUT', 60)
+
+
+def get_groups_key(user_id):
+    return 'paiji2_social:groups-of:%d' % user_id
+
+
+def get_current_bureau_key(group_id):
+    return 'paiji2_social:current-bureau-of:%d' % group_id
+
+
+def memoize(request, key, compute):
+    """
+    Returns the value of ``key`` from the request, else from the cache,
+    else computes it. The signal receivers of Post and Bureau delete the
+    cached values they change.
+    """
+    memo = None
+    if request is not None:
+        memo = request.__dict__.setdefault('_paiji2_social_membership', {})
+        if key in memo:
+            return memo[key]
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, get_cache_timeout())
+    if memo is not None:
+        memo[key] = value
+    return value
+
+
+def get_group_ids(user, request=None):
+    """ Ids of the groups where the user has a post """
+    from .models import Post
+
+    return memoize(
+        request,
+        get_groups_key(user.pk),
+        lambda: frozenset(Post.objects.filter(
+            utilisateur=user,
+        ).values_list('bureau__group', flat=True)),
+    )
+
+
+def get_current_bureau_id(group_id, request=None):
+    """ Id of the current bureau of the group, or None """
+    from .models import Bureau
+
+    def compute():
+        # a tuple, None meaning a cache miss
+        return tuple(Bureau.objects.filter(
+            group_id=group_id,
+            endDate=None,
+        ).values_list('pk', flat=True)[:1])
+
+    current = memoize(request, get_current_bureau_key(group_id), compute)
+    return current[0] if current else None
+
+
+def forget_user(user_id):
+    cache.delete(get_groups_key(user_id))
+
+
+def forget_group(group_id):
+    cache.delete(get_current_bureau_key(group_id))
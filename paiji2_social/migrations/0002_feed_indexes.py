@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiji2_social', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='message',
+            options={'ordering': ('-pubDate', '-id'), 'verbose_name': 'message', 'verbose_name_plural': 'messages'},
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='pubDate',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='publication date', db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='message',
+            index_together=set([('public', 'pubDate', 'id'), ('group', 'pubDate', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='comment',
+            index_together=set([('message', 'pubDate')]),
+        ),
+    ]
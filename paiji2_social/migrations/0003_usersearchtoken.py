@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import re
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+# the tokenizer and the search fields of this migration, the live ones
+# may change
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+TOKEN_LENGTH = 50
+SEARCH_FIELDS = ('first_name', 'last_name', 'username', 'email', 'room')
+
+
+def index_users(apps, schema_editor):
+    """
+    Fills the inverted index. On PostgreSQL the search uses a full text
+    index by default, created by the rebuild_search_index command.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    UserSearchToken = apps.get_model('paiji2_social', 'UserSearchToken')
+    fields = [
+        field.name for field in User._meta.fields
+        if field.name in SEARCH_FIELDS
+    ]
+    tokens = []
+    for user in User.objects.only(*fields).iterator():
+        words = set()
+        for field in fields:
+            words.update(
+                word.lower()[:TOKEN_LENGTH]
+                for word in WORD_RE.findall(unicode(getattr(user, field) or ''))
+            )
+        tokens.extend(
+            UserSearchToken(user_id=user.pk, token=word) for word in words
+        )
+    UserSearchToken.objects.bulk_create(tokens, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('paiji2_social', '0002_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('token', models.CharField(max_length=50, verbose_name='token')),
+                ('user', models.ForeignKey(related_name='search_tokens', verbose_name='user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'user search token',
+                'verbose_name_plural': 'user search tokens',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='usersearchtoken',
+            index_together=set([('token', 'user')]),
+        ),
+        migrations.RunPython(index_users, migrations.RunPython.noop),
+    ]
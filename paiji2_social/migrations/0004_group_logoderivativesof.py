@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiji2_social', '0003_usersearchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='logoDerivativesOf',
+            field=models.CharField(verbose_name='logo of the generated derivatives', max_length=255, editable=False, blank=True),
+        ),
+    ]
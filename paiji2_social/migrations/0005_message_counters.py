@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def recompute_counters(apps, schema_editor):
+    from paiji2_social.counters import recompute_comment_counters
+    recompute_comment_counters(
+        schema_editor.connection,
+        apps.get_model('paiji2_social', 'Message'),
+        apps.get_model('paiji2_social', 'Comment'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiji2_social', '0004_group_logoderivativesof'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='commentCount',
+            field=models.PositiveIntegerField(default=0, verbose_name='number of comments', editable=False),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='lastActivity',
+            field=models.DateTimeField(verbose_name='last activity date', null=True, editable=False, db_index=True),
+        ),
+        migrations.RunPython(recompute_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('paiji2_social', '0005_message_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('pubDate', models.DateTimeField(verbose_name='publication date', db_index=True)),
+                ('message', models.ForeignKey(related_name='timeline_entries', verbose_name='message', to='paiji2_social.Message')),
+                ('user', models.ForeignKey(related_name='timeline', verbose_name='user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'timeline entry',
+                'verbose_name_plural': 'timeline entries',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together=set([('user', 'message')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='timelineentry',
+            index_together=set([('user', 'pubDate', 'message')]),
+        ),
+    ]
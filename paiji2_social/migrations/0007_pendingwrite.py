@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('paiji2_social', '0006_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingWrite',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=10, verbose_name='kind', choices=[('message', 'message'), ('comment', 'comment')])),
+                ('payload', models.TextField(verbose_name='payload')),
+                ('createdOn', models.DateTimeField(auto_now_add=True, verbose_name='creation date')),
+                ('author', models.ForeignKey(related_name='pending_writes', verbose_name='author', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('id',),
+                'verbose_name': 'pending write',
+                'verbose_name_plural': 'pending writes',
+            },
+        ),
+    ]
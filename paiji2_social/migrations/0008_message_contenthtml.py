@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def render_messages(apps, schema_editor):
+    from paiji2_social.sanitizer import render_messages
+    render_messages(apps.get_model('paiji2_social', 'Message'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiji2_social', '0007_pendingwrite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='contentHtml',
+            field=models.TextField(verbose_name='sanitized content', editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='excerpt',
+            field=models.CharField(verbose_name='excerpt', max_length=300, editable=False, blank=True),
+        ),
+        migrations.RunPython(render_messages, migrations.RunPython.noop),
+    ]
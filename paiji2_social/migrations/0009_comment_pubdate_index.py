@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paiji2_social', '0008_message_contenthtml'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='pubDate',
+            field=models.DateTimeField(verbose_name='publication date', db_index=True),
+        ),
+    ]
@@ -1,6 +1,6 @@
-from django.db import models
+from django.db import connections, models
 
-# from django.utils import timezone
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -9,6 +9,8 @@ from django.utils.translation import ugettext as _
 
 from backbone_calendar.models import Calendar
 
+from . import sanitizer
+
 
 try:
     User = get_user_model()
@@ -81,6 +83,13 @@ class Group(models.Model):
         null=True,
     )
 
+    logoDerivativesOf = models.CharField(
+        _('logo of the generated derivatives'),
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
+
     newsfeed = models.URLField(
         _('newsfeed'),
         blank=True,
@@ -127,12 +136,11 @@ class Bureau(models.Model):
     )
 
     def currentBureauExist(self):
+        from .membership import get_current_bureau_id
+
         if self.endDate is None:
-            nb_boards = Bureau.objects.filter(
-                group=self.group,
-                endDate=None,
-            ).count()
-            return nb_boards > 0
+            current = get_current_bureau_id(self.group_id)
+            return current is not None and current != self.pk
         return False
     currentBureauExist.short_description = _('Does it exist ?')
 
@@ -187,6 +195,31 @@ class Post(models.Model):
         unique_together = ('bureau', 'postType',)
 
 
+class MessageQuerySet(models.QuerySet):
+
+    def visible_to(self, user):
+        if not user.is_authenticated():
+            return self.filter(public=True)
+        return self
+
+    def for_feed(self):
+        """
+        Messages as displayed by the news feeds, newest first, with their
+        author and group loaded in the same query. They are displayed from
+        contentHtml, the raw content is not read.
+        """
+        return self.select_related('author', 'group').order_by(
+            '-pubDate', '-id',
+        ).defer('content')
+
+    def add_comments(self, nb, date=None):
+        """ Updates the comment counters of the messages in place """
+        values = {'commentCount': models.F('commentCount') + nb}
+        if date is not None:
+            values['lastActivity'] = date
+        return self.update(**values)
+
+
 class Message(models.Model):
     author = models.ForeignKey(
         User,
@@ -198,6 +231,7 @@ class Message(models.Model):
         _('publication date'),
         auto_now_add=True,
         null=False,
+        db_index=True,
     )
 
     title = models.CharField(
@@ -211,6 +245,20 @@ class Message(models.Model):
         blank=False,
     )
 
+    # computed from the content on save (see sanitizer.py)
+    contentHtml = models.TextField(
+        _('sanitized content'),
+        blank=True,
+        editable=False,
+    )
+
+    excerpt = models.CharField(
+        _('excerpt'),
+        max_length=sanitizer.EXCERPT_LENGTH,
+        blank=True,
+        editable=False,
+    )
+
     public = models.BooleanField(
         verbose_name=_('readable by unregistered visitors'),
         default=False,
@@ -233,13 +281,101 @@ class Message(models.Model):
         default=0,
     )
 
+    commentCount = models.PositiveIntegerField(
+        _('number of comments'),
+        default=0,
+        editable=False,
+    )
+
+    lastActivity = models.DateTimeField(
+        _('last activity date'),
+        null=True,
+        editable=False,
+        db_index=True,
+    )
+
+    objects = MessageQuerySet.as_manager()
+
+    # kept up to date with F() expressions by the comment receivers, a
+    # save of an instance loaded earlier must not write them back
+    counter_fields = ('commentCount', 'lastActivity')
+
+    def save(self, *args, **kwargs):
+        if self.lastActivity is None:
+            self.lastActivity = timezone.now()
+        self.contentHtml, text = sanitizer.sanitize(self.content)
+        self.excerpt = sanitizer.get_excerpt(text)
+        if (not self._state.adding and not kwargs.get('force_insert') and
+                kwargs.get('update_fields') is None and not args):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.name not in self.counter_fields
+            ]
+        super(Message, self).save(*args, **kwargs)
+
     def __unicode__(self):
         return self.title
 
     class Meta:
         verbose_name = _('message')
         verbose_name_plural = _('messages')
-        ordering = ('group__name', '-pubDate', )
+        ordering = ('-pubDate', '-id', )
+        # news feeds read messages newest first, either the public ones
+        # or those of a group; the id breaks the ties of the ordering
+        index_together = (
+            ('public', 'pubDate', 'id'),
+            ('group', 'pubDate', 'id'),
+        )
+
+
+class CommentQuerySet(models.QuerySet):
+
+    def attach_to(self, messages, nb=5):
+        """
+        Loads the first ``nb`` comments of every message in one query and
+        stores them on ``message.page_comments`` for the comment area.
+        The other comments of the messages are not read, their number is
+        given by ``message.commentCount``.
+        """
+        messages = list(messages)
+        by_message = {}
+        for message in messages:
+            message.page_comments = []
+            by_message[message.pk] = message.page_comments
+
+        if by_message:
+            # the ids of the first comments of each message, every branch
+            # reads at most nb rows of the (message, pubDate) index
+            qn = connections[self.db].ops.quote_name
+            columns = {
+                'table': qn(self.model._meta.db_table),
+                'id': qn(self.model._meta.pk.column),
+                'message': qn(self.model._meta.get_field('message').column),
+                'date': qn(self.model._meta.get_field('pubDate').column),
+            }
+            branches = [
+                'SELECT %(id)s FROM (SELECT %(id)s FROM %(table)s '
+                'WHERE %(message)s = %%s ORDER BY %(date)s, %(id)s '
+                'LIMIT %%s) first_%(i)d' % dict(columns, i=i)
+                for i in range(len(by_message))
+            ]
+            params = []
+            for message_id in by_message:
+                params.extend((message_id, nb))
+            comments = self.select_related('author').extra(
+                where=['%s.%s IN (SELECT %s FROM (%s) first_comments)' % (
+                    columns['table'],
+                    columns['id'],
+                    columns['id'],
+                    ' UNION ALL '.join(branches),
+                )],
+                params=params,
+            ).order_by('message', 'pubDate', 'pk')
+            for comment in comments:
+                by_message[comment.message_id].append(comment)
+
+        return messages
 
 
 class Comment(models.Model):
@@ -258,6 +394,7 @@ class Comment(models.Model):
     pubDate = models.DateTimeField(
         _('publication date'),
         null=False,
+        db_index=True,
     )
 
     content = models.CharField(
@@ -266,7 +403,103 @@ class Comment(models.Model):
         blank=False,
     )
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('comment')
         verbose_name_plural = _('comments')
         ordering = ('message', '-pubDate', )
+        index_together = (
+            ('message', 'pubDate'),
+        )
+
+
+class UserSearchToken(models.Model):
+    """ A word of a user, for the directory search (see search.py) """
+    user = models.ForeignKey(
+        User,
+        verbose_name=_('user'),
+        related_name='search_tokens',
+    )
+
+    token = models.CharField(
+        _('token'),
+        max_length=50,
+    )
+
+    class Meta:
+        verbose_name = _('user search token')
+        verbose_name_plural = _('user search tokens')
+        index_together = (
+            ('token', 'user'),
+        )
+
+
+class TimelineEntry(models.Model):
+    """
+    A message in the news of a user, written when the message is posted
+    to the members of its group (see timeline.py).
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name=_('user'),
+        related_name='timeline',
+    )
+
+    message = models.ForeignKey(
+        Message,
+        verbose_name=_('message'),
+        related_name='timeline_entries',
+    )
+
+    pubDate = models.DateTimeField(
+        _('publication date'),
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = _('timeline entry')
+        verbose_name_plural = _('timeline entries')
+        unique_together = ('user', 'message')
+        index_together = (
+            ('user', 'pubDate', 'message'),
+        )
+
+
+class PendingWrite(models.Model):
+    """
+    A message or a comment posted while the write-behind mode is on,
+    saved later by the drain_pending_writes command (see writebehind.py).
+    """
+    MESSAGE = 'message'
+    COMMENT = 'comment'
+    KINDS = (
+        (MESSAGE, _('message')),
+        (COMMENT, _('comment')),
+    )
+
+    kind = models.CharField(
+        _('kind'),
+        max_length=10,
+        choices=KINDS,
+    )
+
+    author = models.ForeignKey(
+        User,
+        verbose_name=_('author'),
+        related_name='pending_writes',
+    )
+
+    payload = models.TextField(
+        _('payload'),
+    )
+
+    createdOn = models.DateTimeField(
+        _('creation date'),
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = _('pending write')
+        verbose_name_plural = _('pending writes')
+        ordering = ('id', )
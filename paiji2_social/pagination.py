@@ -0,0 +1,147 @@
+# -*- encoding: utf-8 -*-
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
+from django.utils.translation import ugettext as _
+
+
+CURSOR_DATE_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def encode_cursor(message):
+    date = message.pubDate
+    if timezone.is_aware(date):
+        date = timezone.make_naive(date, timezone.utc)
+    return '%s-%d' % (date.strftime(CURSOR_DATE_FORMAT), message.pk)
+
+
+def decode_cursor(cursor):
+    try:
+        date, pk = cursor.split('-')
+        date = datetime.strptime(date, CURSOR_DATE_FORMAT)
+        pk = int(pk)
+    except ValueError:
+        raise Http404(_('Invalid page cursor.'))
+    if settings.USE_TZ:
+        date = timezone.make_aware(date, timezone.utc)
+    return date, pk
+
+
+class CursorPage(object):
+    """
+    A page of messages delimited by (pubDate, id) cursors, with the
+    ``has_next``/``has_previous`` interface of Django's pages.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, previous_cursor, next_cursor):
+        self.object_list = object_list
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+
+def cursor_paginate(queryset, per_page, before=None, after=None):
+    """
+    Returns the page of ``queryset`` (ordered by ``-pubDate, -id``) that
+    is older than the ``before`` cursor or newer than the ``after`` one.
+
+    Pages are read with a range on (pubDate, id) instead of an OFFSET and
+    nothing is counted, so every page costs the same single query.
+    """
+    if after is not None:
+        date, pk = decode_cursor(after)
+        object_list = list(queryset.filter(
+            Q(pubDate__gte=date) & (Q(pubDate__gt=date) | Q(pk__gt=pk))
+        ).reverse()[:per_page + 1])
+        has_previous = len(object_list) > per_page
+        object_list = object_list[:per_page]
+        object_list.reverse()
+        has_next = True
+    else:
+        if before is not None:
+            date, pk = decode_cursor(before)
+            queryset = queryset.filter(
+                Q(pubDate__lte=date) & (Q(pubDate__lt=date) | Q(pk__lt=pk))
+            )
+        object_list = list(queryset[:per_page + 1])
+        has_next = len(object_list) > per_page
+        object_list = object_list[:per_page]
+        has_previous = before is not None
+
+    if not object_list:
+        return CursorPage(object_list, None, None)
+    return CursorPage(
+        object_list,
+        encode_cursor(object_list[0]) if has_previous else None,
+        encode_cursor(object_list[-1]) if has_next else None,
+    )
+
+
+ESTIMATE_SQL = {
+    'postgresql': 'SELECT reltuples FROM pg_class WHERE relname = %s',
+    'mysql': (
+        'SELECT table_rows FROM information_schema.tables '
+        'WHERE table_schema = DATABASE() AND table_name = %s'
+    ),
+}
+
+
+def estimate_count(queryset):
+    """
+    Number of rows of the table of an unfiltered queryset, as estimated
+    by the database statistics, or None when it is not known.
+    """
+    query = getattr(queryset, 'query', None)
+    if query is None or query.where:
+        return None
+    connection = connections[queryset.db]
+    sql = ESTIMATE_SQL.get(connection.vendor)
+    if sql is None:
+        return None
+    cursor = connection.cursor()
+    cursor.execute(sql, [queryset.model._meta.db_table])
+    row = cursor.fetchone()
+    return int(row[0]) if row else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator of large tables: an unfiltered queryset is counted from the
+    database statistics when they give more rows than
+    PAIJI2_SOCIAL_ESTIMATED_COUNT_THRESHOLD, instead of a COUNT(*).
+    """
+
+    def _get_count(self):
+        if self._count is None:
+            estimate = estimate_count(self.object_list)
+            threshold = getattr(
+                settings,
+                'PAIJI2_SOCIAL_ESTIMATED_COUNT_THRESHOLD',
+                10000,
+            )
+            if estimate is not None and estimate > threshold:
+                self._count = estimate
+            else:
+                self._count = super(EstimatedCountPaginator, self).count
+        return self._count
+    count = property(_get_count)
@@ -0,0 +1,104 @@
+# -*- encoding: utf-8 -*-
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.utils.decorators import available_attrs
+
+
+PRIMARY_COOKIE = 'paiji2_social_primary'
+
+_state = threading.local()
+
+
+def get_replica():
+    """ Alias of the replica database, None when there is none """
+    replica = getattr(settings, 'PAIJI2_SOCIAL_REPLICA_DB', None)
+    if replica in settings.DATABASES:
+        return replica
+    return None
+
+
+def get_pin_seconds():
+    """ How long the reads of a user stay on the primary after a write """
+    return getattr(settings, 'PAIJI2_SOCIAL_REPLICA_PIN_SECONDS', 10)
+
+
+@contextmanager
+def replica_reads():
+    """ Sends the reads of the current thread to the replica """
+    previous = getattr(_state, 'replica', False)
+    _state.replica = True
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+class ReplicaRouter(object):
+    """
+    Sends the reads made inside replica_reads(), that is by the views
+    decorated with read_from_replica, to PAIJI2_SOCIAL_REPLICA_DB.
+    The instances read from the replica are written to the default
+    database. Every other query is left to the next routers.
+    """
+
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'replica', False):
+            return get_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # otherwise the instances read from the replica are saved back to
+        # it; the other writes are left to the next routers
+        instance = hints.get('instance')
+        replica = get_replica()
+        if (instance is not None and replica is not None and
+                instance._state.db == replica):
+            return 'default'
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        databases = set(['default', get_replica()])
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def read_from_replica(view_func):
+    """
+    Runs the view and renders its response on the replica, unless the
+    user wrote something recently (see pin_to_primary).
+    """
+    @wraps(view_func, assigned=available_attrs(view_func))
+    def _wrapped_view(request, *args, **kwargs):
+        if PRIMARY_COOKIE in request.COOKIES:
+            return view_func(request, *args, **kwargs)
+        with replica_reads():
+            response = view_func(request, *args, **kwargs)
+            # template responses query the database when rendered
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+        return response
+    return _wrapped_view
+
+
+def pin_to_primary(view_func):
+    """
+    Keeps the reads of the user on the primary for a few seconds after
+    a write, so they see their own changes despite the replication lag.
+    """
+    @wraps(view_func, assigned=available_attrs(view_func))
+    def _wrapped_view(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                '1',
+                max_age=get_pin_seconds(),
+                httponly=True,
+            )
+        return response
+    return _wrapped_view
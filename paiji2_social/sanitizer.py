@@ -0,0 +1,157 @@
+# -*- encoding: utf-8 -*-
+import re
+
+from django.utils.html import escape
+from django.utils.html_parser import HTMLParser, HTMLParseError
+from django.utils.six.moves.urllib.parse import urlparse
+from django.utils.text import Truncator
+
+try:
+    from html import unescape
+except ImportError:
+    unescape = HTMLParser().unescape
+
+
+# tags and attributes kept from the TinyMCE html
+TAGS = set([
+    'a', 'b', 'blockquote', 'br', 'code', 'div', 'em', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'hr', 'i', 'img', 'li', 'ol', 'p', 'pre', 's', 'span',
+    'strike', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'th', 'thead',
+    'tr', 'u', 'ul',
+])
+ATTRIBUTES = {
+    'a': set(['href', 'title']),
+    'img': set(['src', 'alt', 'title', 'width', 'height']),
+    'td': set(['colspan', 'rowspan']),
+    'th': set(['colspan', 'rowspan']),
+}
+URL_ATTRIBUTES = set(['href', 'src'])
+URL_SCHEMES = set(['', 'http', 'https', 'ftp', 'mailto'])
+VOID_TAGS = set(['br', 'embed', 'hr', 'img'])
+# tags dropped with their content
+DROPPED_TAGS = set(['script', 'style', 'iframe', 'object', 'embed'])
+# tags separating words in the plain text
+BLOCK_TAGS = set([
+    'blockquote', 'br', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr',
+    'li', 'p', 'pre', 'td', 'th', 'tr',
+])
+
+EXCERPT_LENGTH = 300
+
+IGNORED_URL_CHARS_RE = re.compile(r'[\s\x00-\x1f]+')
+SPACES_RE = re.compile(r'\s+', re.UNICODE)
+
+
+def is_safe_url(url):
+    return urlparse(
+        IGNORED_URL_CHARS_RE.sub('', url),
+    ).scheme.lower() in URL_SCHEMES
+
+
+class Sanitizer(HTMLParser):
+    """
+    Rebuilds the html keeping the whitelisted tags and attributes only,
+    and collects its plain text.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.html = []
+        self.text = []
+        self.open_tags = []
+        self.dropped = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            if tag not in VOID_TAGS:
+                self.dropped += 1
+            return
+        if self.dropped:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(u' ')
+        if tag not in TAGS:
+            return
+        self.html.append(u'<%s%s>' % (tag, u''.join(
+            u' %s="%s"' % (name, escape(value))
+            for name, value in attrs
+            if name in ATTRIBUTES.get(tag, ()) and value is not None and
+            (name not in URL_ATTRIBUTES or is_safe_url(value))
+        )))
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in self.open_tags:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            # void tags have no content, they never increment dropped
+            if tag not in VOID_TAGS:
+                self.dropped = max(self.dropped - 1, 0)
+            return
+        if self.dropped:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(u' ')
+        if tag not in self.open_tags:
+            return
+        # closes the tags left open inside this one
+        while True:
+            open_tag = self.open_tags.pop()
+            self.html.append(u'</%s>' % open_tag)
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropped:
+            self.html.append(escape(data))
+            self.text.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data(unescape(u'&%s;' % name))
+
+    def handle_charref(self, name):
+        self.handle_data(unescape(u'&#%s;' % name))
+
+    def close(self):
+        HTMLParser.close(self)
+        while self.open_tags:
+            self.html.append(u'</%s>' % self.open_tags.pop())
+
+
+def sanitize(content):
+    """ Returns the sanitized html and the plain text of the content """
+    sanitizer = Sanitizer()
+    try:
+        sanitizer.feed(content)
+        sanitizer.close()
+    except HTMLParseError:
+        return escape(content), content
+    return (
+        u''.join(sanitizer.html),
+        SPACES_RE.sub(u' ', u''.join(sanitizer.text)).strip(),
+    )
+
+
+def get_excerpt(text):
+    return Truncator(text).chars(EXCERPT_LENGTH)
+
+
+def render_messages(message_model):
+    """
+    Computes the html and the excerpt of the messages, used by the
+    migrations and the render_messages command. Returns their number.
+    """
+    nb_messages = 0
+    messages = message_model.objects.values_list('pk', 'content')
+    for pk, content in messages.iterator():
+        html, text = sanitize(content)
+        message_model.objects.filter(pk=pk).update(
+            contentHtml=html,
+            excerpt=get_excerpt(text),
+        )
+        nb_messages += 1
+    return nb_messages
@@ -0,0 +1,133 @@
+# -*- encoding: utf-8 -*-
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, When, Sum, IntegerField
+from django.utils.module_loading import import_string
+
+from .models import UserSearchToken
+
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+TOKEN_LENGTH = UserSearchToken._meta.get_field('token').max_length
+
+
+def get_search_fields():
+    """ User fields the directory searches in """
+    fields = ['first_name', 'last_name', 'username', 'email']
+    if not (hasattr(settings, 'CI_TEST') and settings.CI_TEST):
+        fields.append('room')
+    return getattr(settings, 'PAIJI2_SOCIAL_DIRECTORY_SEARCH_FIELDS', fields)
+
+
+def tokenize(text):
+    return [word.lower()[:TOKEN_LENGTH] for word in WORD_RE.findall(text)]
+
+
+class BaseSearchBackend(object):
+    """
+    Finds the users matching every word of a query, ranked by relevance
+    and annotated with ``search_rank``.
+    """
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index_user(self, user):
+        """ Called when a user is saved """
+        pass
+
+
+class InvertedIndexSearchBackend(BaseSearchBackend):
+    """
+    Searches the words of the users kept in the UserSearchToken table. A
+    query word matches the words it prefixes, read as an indexed range.
+    """
+
+    def index_user(self, user):
+        words = set()
+        for field in get_search_fields():
+            words.update(tokenize(unicode(getattr(user, field, '') or '')))
+        UserSearchToken.objects.filter(user=user).delete()
+        UserSearchToken.objects.bulk_create([
+            UserSearchToken(user=user, token=word) for word in words
+        ])
+
+    def search(self, queryset, query):
+        words = tokenize(query)
+        if not words:
+            return queryset
+        for word in words:
+            queryset = queryset.filter(pk__in=UserSearchToken.objects.filter(
+                token__gte=word,
+                token__lt=word + u'\uffff',
+            ).values('user'))
+        # whole words rank before prefixes
+        return queryset.annotate(search_rank=Sum(Case(
+            When(search_tokens__token__in=words, then=1),
+            default=0,
+            output_field=IntegerField(),
+        ))).order_by('-search_rank', 'last_name', 'first_name', 'username')
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Uses PostgreSQL full-text search, served by the GIN index created by
+    the migrations (or the rebuild_search_index command).
+    """
+    index_name = 'paiji2_social_user_search'
+
+    def get_vector_sql(self, model):
+        qn = connection.ops.quote_name
+        names = set(field.name for field in model._meta.fields)
+        return "to_tsvector('simple', %s)" % " || ' ' || ".join(
+            "coalesce(%s, '')" % qn(model._meta.get_field(name).column)
+            for name in get_search_fields() if name in names
+        )
+
+    def get_index_sql(self, model):
+        qn = connection.ops.quote_name
+        return [
+            'DROP INDEX IF EXISTS %s' % qn(self.index_name),
+            'CREATE INDEX %s ON %s USING gin (%s)' % (
+                qn(self.index_name),
+                qn(model._meta.db_table),
+                self.get_vector_sql(model),
+            ),
+        ]
+
+    def search(self, queryset, query):
+        words = tokenize(query)
+        if not words:
+            return queryset
+        vector = self.get_vector_sql(queryset.model)
+        ts_query = ' & '.join(word + ':*' for word in words)
+        return queryset.extra(
+            select={
+                'search_rank': "ts_rank(%s, to_tsquery('simple', %%s))" % (
+                    vector,
+                ),
+            },
+            select_params=[ts_query],
+            where=["%s @@ to_tsquery('simple', %%s)" % vector],
+            params=[ts_query],
+            order_by=['-search_rank', 'last_name', 'first_name', 'username'],
+        )
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'PAIJI2_SOCIAL_SEARCH_BACKEND', None)
+        if path is not None:
+            _backend = import_string(path)()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = InvertedIndexSearchBackend()
+    return _backend
@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .caching import bump_news_marker
+from .images import generate_logo_derivatives
+from .models import Message, Comment, Group, Bureau, Post
+from .search import get_search_backend, get_search_fields
+from . import suggest, timeline, membership
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_news(sender, **kwargs):
+    bump_news_marker()
+
+
+@receiver(post_save, sender=Message)
+def dispatch_message(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw and timeline.is_enabled():
+        timeline.fan_out(instance)
+        timeline.prune()
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        Message.objects.filter(
+            pk=instance.message_id,
+        ).add_comments(1, instance.pubDate)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    Message.objects.filter(
+        pk=instance.message_id,
+        commentCount__gt=0,
+    ).add_comments(-1)
+
+
+@receiver(pre_save, sender=Post)
+def remember_member(sender, instance, raw=False, **kwargs):
+    # the groups of the previous user change too when the post is given
+    # to someone else
+    instance._previous_utilisateur_id = None
+    if instance.pk is not None and not raw:
+        instance._previous_utilisateur_id = Post.objects.filter(
+            pk=instance.pk,
+        ).values_list('utilisateur_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def forget_membership(sender, instance, **kwargs):
+    membership.forget_user(instance.utilisateur_id)
+    previous = getattr(instance, '_previous_utilisateur_id', None)
+    if previous is not None and previous != instance.utilisateur_id:
+        membership.forget_user(previous)
+
+
+@receiver(post_save, sender=Bureau)
+@receiver(post_delete, sender=Bureau)
+def forget_current_bureau(sender, instance, **kwargs):
+    membership.forget_group(instance.group_id)
+
+
+@receiver(post_save, sender=Group)
+def resize_logo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        generate_logo_derivatives(instance)
+
+
+@receiver(post_save, sender=get_user_model())
+def index_user(sender, instance, update_fields=None, **kwargs):
+    """ Keeps the directory search up to date """
+    if update_fields and not set(update_fields) & set(get_search_fields()):
+        # e.g. last_login at each login
+        return
+    get_search_backend().index_user(instance)
+    suggest.update_user(instance)
+
+
+@receiver(post_delete, sender=get_user_model())
+def unindex_user(sender, instance, **kwargs):
+    suggest.remove_user(instance)
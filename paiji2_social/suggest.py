@@ -0,0 +1,131 @@
+# -*- encoding: utf-8 -*-
+import threading
+
+from django.contrib.auth import get_user_model
+
+from .search import tokenize
+
+
+# trie nodes map a character to the next node, and USERS to the users
+# having the word that ends at the node
+USERS = None
+
+
+class PrefixIndex(object):
+    """
+    Process-local trie of the words of the usernames and names of the
+    users, answering the directory type-ahead without the database.
+    """
+
+    def __init__(self):
+        self.root = {}
+        self.users = {}
+        self.lock = threading.Lock()
+
+    def add(self, pk, username, name):
+        words = set(tokenize(username) + tokenize(name))
+        with self.lock:
+            self._remove(pk)
+            self.users[pk] = (username, name, words)
+            for word in words:
+                node = self.root
+                for char in word:
+                    node = node.setdefault(char, {})
+                node.setdefault(USERS, set()).add(pk)
+
+    def remove(self, pk):
+        with self.lock:
+            self._remove(pk)
+
+    def _remove(self, pk):
+        if pk not in self.users:
+            return
+        for word in self.users.pop(pk)[2]:
+            path = [self.root]
+            for char in word:
+                path.append(path[-1][char])
+            path[-1][USERS].discard(pk)
+            if not path[-1][USERS]:
+                del path[-1][USERS]
+            # prunes the branches left empty
+            for node, char in reversed(list(zip(path[:-1], word))):
+                if node[char]:
+                    break
+                del node[char]
+
+    def _find(self, word):
+        node = self.root
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                return set()
+        found = set()
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            for key, value in node.items():
+                if key is USERS:
+                    found.update(value)
+                else:
+                    nodes.append(value)
+        return found
+
+    def suggest(self, query, limit=10):
+        """
+        Users having, for every word of the query, a word starting with
+        it, shortest names first.
+        """
+        words = sorted(set(tokenize(query)), key=len)
+        if not words:
+            return []
+        with self.lock:
+            # the longest word is the most selective
+            pks = self._find(words[-1])
+            suggestions = []
+            for pk in pks:
+                username, name, user_words = self.users[pk]
+                if all(
+                    any(user_word.startswith(word) for user_word in user_words)
+                    for word in words[:-1]
+                ):
+                    suggestions.append((username, name))
+        suggestions.sort(key=lambda user: (len(user[0]), user))
+        return suggestions[:limit]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_full_name(first_name, last_name):
+    return u' '.join(name for name in (first_name, last_name) if name)
+
+
+def get_prefix_index():
+    """ Returns the index, loaded with every user on first use """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = PrefixIndex()
+                users = get_user_model().objects.values_list(
+                    'pk', 'username', 'first_name', 'last_name',
+                )
+                for pk, username, first, last in users.iterator():
+                    index.add(pk, username, get_full_name(first, last))
+                _index = index
+    return _index
+
+
+def update_user(user):
+    if _index is not None:
+        _index.add(
+            user.pk,
+            user.username,
+            get_full_name(user.first_name, user.last_name),
+        )
+
+
+def remove_user(user):
+    if _index is not None:
+        _index.remove(user.pk)
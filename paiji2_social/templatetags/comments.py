@@ -12,13 +12,19 @@ register = template.Library()
     takes_context=True,
 )
 def display_comment_area(context, on_message, nb=5):
-    comments = Comment.objects.select_related('author').filter(
-        message=on_message
-    ).order_by('pubDate')[:nb]
+    if hasattr(on_message, 'page_comments'):
+        # loaded for the whole page by the view (Comment.objects.attach_to)
+        comments = on_message.page_comments[:nb]
+    else:
+        comments = Comment.objects.select_related('author').filter(
+            message=on_message
+        ).order_by('pubDate')[:nb]
 
+    comments = list(comments)
     return {
         'request': context['request'],
         'comments': comments,
+        'more_comments': on_message.commentCount - len(comments),
         'on_message': on_message,
         'form': CommentForm(auto_id=False),
     }
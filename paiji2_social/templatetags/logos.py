@@ -0,0 +1,11 @@
+from django import template
+
+from ..images import get_logo_url
+
+
+register = template.Library()
+
+
+@register.filter
+def logo_url(group, size='thumbnail'):
+    return get_logo_url(group, size)
@@ -1,15 +1,33 @@
 # -*- encoding: utf-8 -*-
 import os
-from django.test import TestCase
+import json
+import functools
+from unittest import skipUnless
+from django.test import TestCase, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.db import connection
 from htmlvalidator.client import ValidatingClient
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.core.urlresolvers import reverse
-from django.utils import timezone
+from django.utils import timezone, translation
 from django.conf import settings
 from django.core.files import File
+from django.core.management import call_command
+from django.core.cache import cache
+from django.template import Context, Node
 
 from backbone_calendar.models import Calendar
-from . import models
+from . import (
+    models, suggest, images, membership, benchmark, routers, instrumentation,
+    budgets, caching,
+)
+from .pagination import (
+    encode_cursor, estimate_count, EstimatedCountPaginator,
+)
+from .sanitizer import sanitize
+from .templatetags.comments import display_comment_area
+from .views import MessageListView
 
 
 User = get_user_model()
@@ -246,3 +264,994 @@ class PagesTestCase(BaseTestCase):
 
         response = self.client.get(reverse('feed-latest'))
         self.assertEqual(response.status_code, 200)
+
+
+class QueriesTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(QueriesTestCase, self).setUp()
+        # the query count does not depend on the html validation
+        self.client = Client()
+
+    def add_messages(self, nb, group=None):
+        for i in range(nb):
+            message_group = group or models.Group.objects.create(
+                name='group %d' % i,
+                slug='group-%d' % i,
+                category=self.normal_groups,
+                logo=self.logo,
+            )
+            message = models.Message.objects.create(
+                author=self.gontran,
+                title='Message %d' % i,
+                content='Content %d' % i,
+                public=True,
+                group=message_group,
+            )
+            models.Comment.objects.create(
+                author=self.brunehilde,
+                message=message,
+                pubDate=timezone.now(),
+                content='Comment %d' % i,
+            )
+
+    def assertConstantQueries(self, url, group=None):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.add_messages(4, group)
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+
+class NewsQueriesTestCase(QueriesTestCase):
+
+    def test_index(self):
+        self.assertConstantQueries(reverse('index'))
+
+    def test_group_news(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        self.assertConstantQueries(reverse(
+            'workgroup-news',
+            args=[self.best_group.slug],
+        ), self.best_group)
+
+    def test_feed(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        self.assertConstantQueries(reverse('feed-latest'))
+
+
+class CommentAreaTestCase(QueriesTestCase):
+
+    def test_first_comments(self):
+        messages = models.Comment.objects.attach_to(
+            [self.first_message, self.second_message],
+            1,
+        )
+        self.assertEqual(
+            [message.page_comments for message in messages],
+            [[self.first_comment], [self.third_comment]],
+        )
+
+    def test_comments_per_message(self):
+        MessageListView.comments_per_message = 1
+        try:
+            response = self.client.get(reverse('index'))
+        finally:
+            del MessageListView.comments_per_message
+        self.assertContains(response, '1 more comment')
+
+    def test_more_comments(self):
+        message = models.Message.objects.get(pk=self.first_message.pk)
+        models.Comment.objects.attach_to([message], 1)
+        context = display_comment_area({'request': None}, message, nb=1)
+        self.assertEqual(context['comments'], [self.first_comment])
+        self.assertEqual(context['more_comments'], 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is sqlite')
+class NewsIndexesTestCase(BaseTestCase):
+
+    def assertUsesIndex(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        plan = ' | '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING INDEX', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_home_query(self):
+        self.assertUsesIndex(
+            models.Message.objects.filter(public=True).for_feed()[:5]
+        )
+        self.assertUsesIndex(models.Message.objects.for_feed()[:5])
+
+    def test_group_news_query(self):
+        self.assertUsesIndex(
+            models.Message.objects.filter(
+                group=self.best_group,
+            ).for_feed()[:8]
+        )
+
+
+class CursorPaginationTestCase(QueriesTestCase):
+
+    def test_pages(self):
+        self.add_messages(12, self.best_group)
+        messages = list(models.Message.objects.filter(
+            public=True,
+        ).for_feed())
+
+        response = self.client.get(reverse('index') + '?before=')
+        self.assertEqual(response.status_code, 404)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('index') + '?before=' + encode_cursor(messages[0])
+            )
+        self.assertEqual(
+            [m.pk for m in response.context['news']],
+            [m.pk for m in messages[1:6]],
+        )
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in queries.captured_queries
+        ))
+
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(
+                reverse('index') + '?before=' + encode_cursor(messages[-6])
+            )
+        self.assertEqual(
+            [m.pk for m in response.context['news']],
+            [m.pk for m in messages[-5:]],
+        )
+        self.assertFalse(response.context['page_obj'].has_next())
+
+        response = self.client.get(
+            reverse('index') + '?after=' + encode_cursor(messages[6])
+        )
+        self.assertEqual(
+            [m.pk for m in response.context['news']],
+            [m.pk for m in messages[1:6]],
+        )
+
+        response = self.client.get(reverse('index') + '?page=2')
+        self.assertEqual(response.status_code, 200)
+
+
+class NewsCacheTestCase(QueriesTestCase):
+
+    def test_public_news_feed(self):
+        self.client.get(reverse('index'))
+        # only the validator of the conditional GET is computed
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Welcome my friends !')
+
+        models.Comment.objects.create(
+            author=self.gontran,
+            message=self.first_message,
+            pubDate=timezone.now(),
+            content='A brand new comment',
+        )
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'A brand new comment')
+
+        self.first_message.delete()
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, 'Welcome my friends !')
+
+    def test_language(self):
+        request = RequestFactory().get(reverse('index'))
+        request.user = AnonymousUser()
+        with translation.override('en'):
+            english = caching.news_feed_cache_key(request)
+        with translation.override('fr'):
+            french = caching.news_feed_cache_key(request)
+        self.assertNotEqual(english, french)
+
+
+class ConditionalGetTestCase(QueriesTestCase):
+
+    def test_index(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # only the validator is computed
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('index'),
+                HTTP_IF_NONE_MATCH=etag,
+            )
+        self.assertEqual(response.status_code, 304)
+
+        models.Comment.objects.create(
+            author=self.gontran,
+            message=self.first_message,
+            pubDate=timezone.now(),
+            content='A brand new comment',
+        )
+        response = self.client.get(
+            reverse('index'),
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_feed(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        response = self.client.get(reverse('feed-latest'))
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = self.client.get(
+            reverse('feed-latest'),
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_csrf_token(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        url = reverse('workgroup-news', args=[self.best_group.slug])
+        response = self.client.get(url)
+        etag = response['ETag']
+        # as rotated by a new login
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_last_modified_edit(self):
+        request = RequestFactory().get(reverse('feed-latest'))
+        last_modified = caching.news_last_modified(request)
+        self.first_message.title = 'Edited'
+        self.first_message.save()
+        request = RequestFactory().get(reverse('feed-latest'))
+        self.assertGreater(
+            caching.news_last_modified(request),
+            last_modified,
+        )
+
+
+class FeedsTestCase(QueriesTestCase):
+
+    def test_feeds(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        self.add_messages(2)
+        response = self.client.get(reverse(
+            'workgroup-feed',
+            args=[self.best_group.slug],
+        ))
+        self.assertContains(response, 'Welcome my friends !')
+        self.assertNotContains(response, 'Message 0')
+
+        response = self.client.get(reverse(
+            'workgroup-feed-atom',
+            args=[self.best_group.slug],
+        ))
+        self.assertTrue(response['Content-Type'].startswith(
+            'application/atom+xml'
+        ))
+
+        response = self.client.get(reverse('feed-latest-atom'))
+        self.assertContains(response, 'Message 0')
+
+        # served from the cache until the news change
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('feed-latest-atom'))
+        self.assertContains(response, 'Message 0')
+
+        # with the links of the host and the scheme asked
+        response = self.client.get(
+            reverse('feed-latest-atom'),
+            HTTP_HOST='other.example.com',
+            secure=True,
+        )
+        self.assertContains(response, 'https://other.example.com/')
+        self.assertNotContains(response, 'http://testserver/')
+
+
+class DirectorySearchTestCase(QueriesTestCase):
+
+    def search(self, query):
+        response = self.client.get(reverse('directory'), {'q': query})
+        return [user.username for user in response.context['users']]
+
+    def test_search(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        self.assertEqual(self.search('gont'), ['gontran'])
+        self.assertEqual(self.search('GONTRAN'), ['gontran'])
+        self.assertEqual(self.search('gont brune'), [])
+        self.assertEqual(len(self.search('')), 2)
+
+        self.gontran.first_name = 'Brunehaut'
+        self.gontran.save()
+        self.assertEqual(self.search('gont brune'), ['gontran'])
+        self.assertEqual(self.search('brune'), ['brunehilde', 'gontran'])
+
+    def test_suggest(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        self.gontran.first_name = 'Gontran'
+        self.gontran.last_name = 'Dupont'
+        self.gontran.save()
+        # loads the index of this test database
+        suggest._index = None
+        self.client.get(reverse('directory-suggest'), {'q': 'g'})
+
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('directory-suggest'),
+                {'q': 'dup'},
+            )
+        self.assertEqual(json.loads(response.content.decode('utf-8')), [
+            {'username': 'gontran', 'name': 'Gontran Dupont'},
+        ])
+
+        self.gontran.delete()
+        response = self.client.get(reverse('directory-suggest'), {'q': 'dup'})
+        self.assertEqual(json.loads(response.content.decode('utf-8')), [])
+
+
+class GroupMembersQueriesTestCase(QueriesTestCase):
+
+    def test_members(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        url = reverse('workgroup-members', args=[self.best_group.slug])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+
+        for i in range(3):
+            bureau = models.Bureau.objects.create(group=self.best_group)
+            for user, post_type in (
+                (self.gontran, self.president),
+                (self.brunehilde, self.director),
+            ):
+                models.Post.objects.create(
+                    utilisateur=user,
+                    bureau=bureau,
+                    postType=post_type,
+                )
+
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['bureaus']), 4)
+
+
+class GroupDirectoryTestCase(QueriesTestCase):
+
+    def test_directory(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        self.best_group.refresh_from_db()
+        self.assertEqual(
+            self.best_group.logoDerivativesOf,
+            images.get_derivatives_signature(self.best_group.logo.name),
+        )
+        self.assertFalse(images.generate_logo_derivatives(self.best_group))
+        self.assertConstantQueries(reverse('groups'))
+        response = self.client.get(reverse('groups'))
+        self.assertContains(response, '.thumbnail.png')
+
+    def test_without_logo(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        group = models.Group.objects.create(
+            name='No logo',
+            slug='no-logo',
+            category=self.normal_groups,
+        )
+        self.assertIsNone(images.get_logo_url(group, 'thumbnail'))
+        response = self.client.get(reverse('groups'))
+        self.assertContains(response, 'No logo')
+
+
+class MessageCountersTestCase(QueriesTestCase):
+
+    def assertCounters(self, message, count, last_activity):
+        message.refresh_from_db()
+        self.assertEqual(message.commentCount, count)
+        self.assertEqual(message.lastActivity, last_activity)
+
+    def test_counters(self):
+        self.assertCounters(
+            self.first_message, 2, self.second_comment.pubDate,
+        )
+        self.second_comment.delete()
+        self.assertCounters(
+            self.first_message, 1, self.second_comment.pubDate,
+        )
+
+        models.Message.objects.update(commentCount=0)
+        call_command('recompute_message_counters')
+        self.assertCounters(
+            self.first_message, 1, self.first_comment.pubDate,
+        )
+        self.assertCounters(
+            self.second_message, 1, self.third_comment.pubDate,
+        )
+
+    def test_save_keeps_counters(self):
+        message = models.Message.objects.get(pk=self.first_message.pk)
+        comment = models.Comment.objects.create(
+            author=self.brunehilde,
+            message=self.first_message,
+            pubDate=timezone.now(),
+            content='Meanwhile',
+        )
+        message.title = 'Edited'
+        message.save()
+        self.assertCounters(message, 3, comment.pubDate)
+        self.assertEqual(message.title, 'Edited')
+
+    def test_most_active(self):
+        models.Comment.objects.create(
+            author=self.brunehilde,
+            message=self.first_message,
+            pubDate=timezone.now(),
+            content='Up !',
+        )
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        response = self.client.get(reverse('index'), {'sort': 'active'})
+        self.assertEqual(
+            list(response.context['news']),
+            [self.first_message, self.second_message],
+        )
+
+
+@override_settings(PAIJI2_SOCIAL_TIMELINE=True)
+class TimelineTestCase(QueriesTestCase):
+
+    def test_timeline(self):
+        outsider = User.objects.create_user(
+            'outsider',
+            password='outsider_password',
+        )
+        message = models.Message.objects.create(
+            author=outsider,
+            title='For the members',
+            content='Hello members',
+            group=self.best_group,
+        )
+        self.assertEqual(
+            set(message.timeline_entries.values_list('user', flat=True)),
+            set([self.gontran.pk, self.brunehilde.pk, outsider.pk]),
+        )
+
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        response = self.client.get(reverse('newsfeed-mine'))
+        self.assertEqual(
+            list(response.context['news']),
+            [message, self.second_message, self.first_message],
+        )
+
+        call_command('rebuild_timelines')
+        self.assertEqual(models.TimelineEntry.objects.filter(
+            user=self.brunehilde,
+        ).count(), 3)
+
+        with self.settings(PAIJI2_SOCIAL_TIMELINE=False):
+            response = self.client.get(reverse('newsfeed-mine'))
+            self.assertEqual(response.status_code, 404)
+
+
+class MembershipTestCase(QueriesTestCase):
+
+    def test_message_form(self):
+        self.client.login(
+            username='gontran',
+            password='gontran_password',
+        )
+        response = self.client.get(reverse('newsfeed-add'))
+        self.assertEqual(
+            list(response.context['form'].fields['group'].queryset),
+            [self.best_group],
+        )
+        # the groups of the user come from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                membership.get_group_ids(self.gontran),
+                set([self.best_group.pk]),
+            )
+
+        self.gontran_post.delete()
+        response = self.client.get(reverse('newsfeed-add'))
+        self.assertEqual(
+            list(response.context['form'].fields['group'].queryset),
+            [],
+        )
+
+    def test_post_given_to_another_user(self):
+        membership.get_group_ids(self.gontran)
+        membership.get_group_ids(self.brunehilde)
+        self.gontran_post.utilisateur = self.brunehilde
+        self.gontran_post.save()
+        self.assertEqual(membership.get_group_ids(self.gontran), set())
+        self.assertEqual(
+            membership.get_group_ids(self.brunehilde),
+            set([self.best_group.pk]),
+        )
+
+    def test_current_bureau(self):
+        self.assertFalse(self.my_bureau.currentBureauExist())
+        bureau = models.Bureau(group=self.best_group, endDate=None)
+        self.assertTrue(bureau.currentBureauExist())
+        self.my_bureau.endDate = timezone.now()
+        self.my_bureau.save()
+        self.assertFalse(bureau.currentBureauExist())
+
+
+class OwnershipQueriesTestCase(QueriesTestCase):
+
+    def assertMessageReadOnce(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = method(url, data or {})
+        table = connection.ops.quote_name(models.Message._meta.db_table)
+        # some backends log a prefix before the statement, e.g. SQLite
+        self.assertEqual(len([
+            query for query in queries
+            if 'SELECT' in query['sql'] and
+            'FROM %s' % table in query['sql']
+        ]), 1)
+        return response
+
+    def test_owner(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        url = reverse('newsfeed-edit', args=[self.first_message.pk])
+        response = self.assertMessageReadOnce(self.client.get, url)
+        self.assertEqual(response.status_code, 200)
+
+        url = reverse('newsfeed-delete', args=[self.first_message.pk])
+        response = self.assertMessageReadOnce(self.client.get, url)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertMessageReadOnce(
+            self.client.post,
+            url,
+            {'next': reverse('index')},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(models.Message.objects.filter(
+            pk=self.first_message.pk,
+        ).exists())
+
+    def test_not_owner(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        for name in ('newsfeed-edit', 'newsfeed-delete'):
+            url = reverse(name, args=[self.second_message.pk])
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+
+
+class CommentApiTestCase(QueriesTestCase):
+
+    def post_json(self, data):
+        return self.client.post(
+            reverse('comment-api'),
+            json.dumps(data),
+            content_type='application/json',
+        )
+
+    def test_comments(self):
+        self.client.login(
+            username='gontran',
+            password='gontran_password',
+        )
+        response = self.post_json({
+            'message': self.second_message.pk,
+            'content': 'In place',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('In place', json.loads(response.content)['html'])
+
+        response = self.post_json([
+            {'message': self.first_message.pk, 'content': 'One'},
+            {'message': self.second_message.pk, 'content': 'Two'},
+            {'message': self.second_message.pk, 'content': 'Three'},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(json.loads(response.content)), 3)
+        self.assertEqual(
+            models.Message.objects.get(pk=self.second_message.pk).commentCount,
+            self.second_message.comment.count(),
+        )
+
+    def test_errors(self):
+        self.client.login(
+            username='gontran',
+            password='gontran_password',
+        )
+        count = models.Comment.objects.count()
+        response = self.post_json([
+            {'message': self.first_message.pk, 'content': 'Lost'},
+            {'message': 0, 'content': 'Nowhere'},
+        ])
+        self.assertEqual(response.status_code, 404)
+        response = self.post_json({'message': self.first_message.pk})
+        self.assertEqual(response.status_code, 400)
+        response = self.post_json([
+            {'message': self.first_message.pk, 'content': 'Many'},
+        ] * 21)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(models.Comment.objects.count(), count)
+
+        response = self.client.post(
+            reverse('comment-add', args=[0]),
+            {'content': 'Nowhere', 'next': ''},
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(PAIJI2_SOCIAL_WRITE_BEHIND=True)
+class WriteBehindTestCase(QueriesTestCase):
+
+    def test_queue(self):
+        self.client.login(
+            username='gontran',
+            password='gontran_password',
+        )
+        nb_messages = models.Message.objects.count()
+        nb_comments = models.Comment.objects.count()
+        response = self.client.post(reverse('newsfeed-add'), {
+            'group': self.best_group.pk,
+            'title': 'Later',
+            'content': 'Saved later',
+        })
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post(
+            reverse('comment-add', args=[self.first_message.pk]),
+            {'content': 'Later too', 'next': ''},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(models.PendingWrite.objects.count(), 2)
+        self.assertEqual(models.Message.objects.count(), nb_messages)
+        submitted = timezone.now()
+
+        call_command('drain_pending_writes', batch_size=1)
+        self.assertFalse(models.PendingWrite.objects.exists())
+        self.assertEqual(models.Message.objects.count(), nb_messages + 1)
+        # published when submitted, not when drained
+        self.assertLess(
+            models.Message.objects.get(title='Later').pubDate,
+            submitted,
+        )
+        self.assertEqual(models.Comment.objects.count(), nb_comments + 1)
+        # the signal receivers ran
+        self.assertEqual(
+            models.Message.objects.get(pk=self.first_message.pk).commentCount,
+            self.first_message.comment.count(),
+        )
+
+    def test_comment_api(self):
+        self.client.login(
+            username='gontran',
+            password='gontran_password',
+        )
+        nb_comments = models.Comment.objects.count()
+        response = self.client.post(
+            reverse('comment-api'),
+            json.dumps([
+                {'message': self.first_message.pk, 'content': 'Queued'},
+                {'message': self.second_message.pk, 'content': 'Too'},
+            ]),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(models.PendingWrite.objects.count(), 2)
+        self.assertEqual(models.Comment.objects.count(), nb_comments)
+
+        call_command('drain_pending_writes')
+        self.assertEqual(models.Comment.objects.count(), nb_comments + 2)
+
+
+class MessageRenderingTestCase(QueriesTestCase):
+
+    def test_sanitized(self):
+        message = models.Message.objects.create(
+            author=self.gontran,
+            title='Scripted',
+            content='<p onclick="x()">Hello <script>alert(1)</script>'
+                    '<a href="javascript:x()">you</a></p>',
+            public=True,
+            group=self.best_group,
+        )
+        self.assertEqual(message.contentHtml, '<p>Hello <a>you</a></p>')
+        self.assertEqual(message.excerpt, 'Hello you')
+
+        models.Message.objects.filter(pk=message.pk).update(
+            contentHtml='',
+            excerpt='',
+        )
+        call_command('render_messages')
+        message = models.Message.objects.get(pk=message.pk)
+        self.assertEqual(message.excerpt, 'Hello you')
+
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '<p>Hello <a>you</a></p>', html=True)
+        self.assertNotContains(response, 'alert(1)')
+
+    def test_embed(self):
+        self.assertEqual(
+            sanitize('<p>Before <embed src="x.swf"> after</p><p>Next</p>'),
+            ('<p>Before  after</p><p>Next</p>', 'Before after Next'),
+        )
+        self.assertEqual(
+            sanitize('<script><embed></embed></script><p>Next</p>'),
+            ('<p>Next</p>', 'Next'),
+        )
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_routes(self):
+        benchmark.seed(
+            nb_users=20,
+            nb_groups=4,
+            nb_messages=50,
+            nb_comments=100,
+        )
+        results = benchmark.run(Client(), repeat=1)
+        self.assertEqual(results['index']['status'], 200)
+        self.assertEqual(results['workgroup-news']['status'], 200)
+        self.assertEqual(results['newsfeed-edit']['status'], 200)
+
+        baseline = dict(
+            (name, dict(result, queries=result['queries'] - 1))
+            for name, result in results.items()
+        )
+        self.assertEqual(
+            len(benchmark.compare(results, baseline, tolerance=1000)),
+            len(results),
+        )
+
+
+class AdminPaginationTestCase(BaseTestCase):
+
+    def test_estimated_count(self):
+        comments = models.Comment.objects.all()
+        self.assertIsNone(estimate_count(comments.filter(
+            message=self.first_message,
+        )))
+        paginator = EstimatedCountPaginator(comments, 2)
+        if estimate_count(comments) is None:
+            # no statistics, the rows are counted
+            self.assertEqual(paginator.count, 3)
+        self.assertEqual(paginator.page(1).object_list.count(), 2)
+
+
+@override_settings(PAIJI2_SOCIAL_REPLICA_DB='replica')
+class ReplicaTestCase(QueriesTestCase):
+    multi_db = True
+
+    def test_replica(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        # the replica database of the tests is left empty
+        response = self.client.get(reverse('index'))
+        self.assertEqual(list(response.context['news']), [])
+
+        response = self.client.post(
+            reverse('comment-add', args=[self.first_message.pk]),
+            {'content': 'Mine', 'next': ''},
+        )
+        self.assertIn(routers.PRIMARY_COOKIE, response.cookies)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(
+            list(response.context['news']),
+            [self.second_message, self.first_message],
+        )
+
+        del self.client.cookies[routers.PRIMARY_COOKIE]
+        response = self.client.get(reverse('index'))
+        self.assertEqual(list(response.context['news']), [])
+
+    def test_writes(self):
+        router = routers.ReplicaRouter()
+        message = models.Message.objects.get(pk=self.first_message.pk)
+        self.assertIsNone(router.db_for_write(
+            models.Message,
+            instance=message,
+        ))
+        message._state.db = 'replica'
+        self.assertEqual(
+            router.db_for_write(models.Message, instance=message),
+            'default',
+        )
+        self.assertTrue(router.allow_relation(message, self.best_group))
+        self.best_group._state.db = 'other'
+        self.assertIsNone(router.allow_relation(message, self.best_group))
+
+
+@override_settings(
+    MIDDLEWARE_CLASSES=(
+        'paiji2_social.instrumentation.InstrumentationMiddleware',
+    ) + settings.MIDDLEWARE_CLASSES,
+    PAIJI2_SOCIAL_INSTRUMENTATION_SAMPLE_RATE=1,
+)
+class InstrumentationTestCase(QueriesTestCase):
+
+    def setUp(self):
+        super(InstrumentationTestCase, self).setUp()
+        instrumentation.reset()
+
+    def test_index(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        summary = instrumentation.get_summary()['index']
+        self.assertEqual(summary['queries']['max'], len(queries))
+        self.assertEqual(summary['tag:display_comment_area']['count'], 1)
+
+        with self.settings(PAIJI2_SOCIAL_INSTRUMENTATION_SAMPLE_RATE=0):
+            self.client.get(reverse('index'))
+        summary = instrumentation.get_summary()['index']
+        self.assertEqual(summary['time']['count'], 1)
+
+    def test_debug_cursor(self):
+        self.client.get(reverse('index'))
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_partial_tag(self):
+        class PartialNode(Node):
+            def __init__(self, text):
+                self.text = text
+
+            def render(self, context):
+                return self.text
+
+        # how the template libraries register some of their tags
+        def compile_function(parser, token, text):
+            return PartialNode(text)
+        compile_partial = instrumentation.timed_tag(
+            'partial',
+            functools.partial(compile_function, text='rendered'),
+        )
+        node = compile_partial(None, None)
+
+        instrumentation._state.sample = instrumentation.Sample()
+        try:
+            self.assertEqual(node.render(Context()), 'rendered')
+            sample = instrumentation._state.sample
+        finally:
+            instrumentation._state.sample.queries.stop()
+            instrumentation._state.sample = None
+        self.assertIn('partial', sample.tags)
+
+
+@override_settings(
+    MIDDLEWARE_CLASSES=(
+        'paiji2_social.budgets.QueryBudgetMiddleware',
+    ) + settings.MIDDLEWARE_CLASSES,
+    PAIJI2_SOCIAL_QUERY_BUDGETS_FAIL=True,
+    PAIJI2_SOCIAL_TIMELINE=True,
+)
+class QueryBudgetsTestCase(TestCase):
+
+    def test_routes(self):
+        benchmark.seed(
+            nb_users=50,
+            nb_groups=10,
+            nb_messages=200,
+            nb_comments=400,
+        )
+        # the exports are for the staff
+        User.objects.filter(username=benchmark.USERNAME % 0).update(
+            is_staff=True,
+        )
+        client = Client()
+        client.login(
+            username=benchmark.USERNAME % 0,
+            password=benchmark.PASSWORD,
+        )
+        for name, kwargs in benchmark.get_routes():
+            cache.clear()
+            response = client.get(
+                reverse(name, kwargs=kwargs),
+                benchmark.QUERY_STRINGS.get(name, {}),
+            )
+            self.assertEqual(response.status_code, 200, name)
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_duplicates(self):
+        queries = [
+            {'sql': 'SELECT * FROM "user" WHERE "id" = %d' % pk}
+            for pk in range(3)
+        ]
+        with self.assertRaisesRegexp(
+            budgets.QueryBudgetExceeded,
+            '9 x SELECT',
+        ):
+            budgets.check_budget('workgroup-members', queries * 3)
+
+
+class ExportsTestCase(QueriesTestCase):
+
+    def setUp(self):
+        super(ExportsTestCase, self).setUp()
+        self.gontran.first_name = 'Gontran'
+        self.gontran.email = 'gontran@example.com'
+        self.gontran.is_staff = True
+        self.gontran.save()
+
+    def test_permissions(self):
+        self.client.login(
+            username='brunehilde',
+            password='brunehilde_password',
+        )
+        response = self.client.get(reverse('directory-export', args=['csv']))
+        self.assertEqual(response.status_code, 302)
+
+    def test_directory(self):
+        self.client.login(
+            username='gontran',
+            password='gontran_password',
+        )
+        response = self.client.get(
+            reverse('directory-export', args=['csv']),
+            {'q': 'gont'},
+        )
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn(b'gontran@example.com', lines[1])
+
+        with self.settings(PAIJI2_SOCIAL_EXPORT_CHUNK_SIZE=1):
+            response = self.client.get(
+                reverse('directory-export', args=['vcf']),
+            )
+            content = b''.join(response.streaming_content)
+        self.assertEqual(content.count(b'BEGIN:VCARD'), 2)
+        self.assertIn(b'FN:Gontran', content)
+
+    def test_group_members(self):
+        self.client.login(
+            username='gontran',
+            password='gontran_password',
+        )
+        response = self.client.get(reverse(
+            'workgroup-members-export',
+            args=[self.best_group.slug, 'vcf'],
+        ))
+        content = b''.join(response.streaming_content)
+        self.assertEqual(content.count(b'BEGIN:VCARD'), 2)
+        self.assertIn(b'TITLE:president', content)
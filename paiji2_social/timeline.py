@@ -0,0 +1,65 @@
+# -*- encoding: utf-8 -*-
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Message, Post, TimelineEntry
+
+
+def is_enabled():
+    return getattr(settings, 'PAIJI2_SOCIAL_TIMELINE', False)
+
+
+def get_retention_start():
+    """ Older entries are removed from the timelines """
+    return timezone.now() - timedelta(
+        days=getattr(settings, 'PAIJI2_SOCIAL_TIMELINE_RETENTION_DAYS', 90),
+    )
+
+
+def get_member_ids(group_id):
+    """ The members of the current bureau of the group """
+    return set(Post.objects.filter(
+        bureau__group_id=group_id,
+        bureau__endDate__isnull=True,
+    ).values_list('utilisateur', flat=True))
+
+
+def fan_out(message, member_ids=None):
+    """ Adds the message to the timelines of its group and its author """
+    if member_ids is None:
+        member_ids = get_member_ids(message.group_id)
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(
+            user_id=user_id,
+            message_id=message.pk,
+            pubDate=message.pubDate,
+        )
+        for user_id in member_ids | set([message.author_id])
+    ])
+
+
+def prune():
+    TimelineEntry.objects.filter(
+        pubDate__lt=get_retention_start(),
+    ).delete()
+
+
+def rebuild():
+    """
+    Writes the timelines again from the messages of the retention period
+    and the current bureaus.
+    """
+    TimelineEntry.objects.all().delete()
+    members = {}
+    messages = Message.objects.filter(
+        pubDate__gte=get_retention_start(),
+    ).only('pk', 'author', 'group', 'pubDate')
+    nb_messages = 0
+    for message in messages.iterator():
+        if message.group_id not in members:
+            members[message.group_id] = get_member_ids(message.group_id)
+        fan_out(message, members[message.group_id])
+        nb_messages += 1
+    return nb_messages
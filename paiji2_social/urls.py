@@ -1,60 +1,102 @@
 from django.conf.urls import url  # , patterns
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.views.decorators.http import condition
 
 from .views import (
     MessageListView,
+    TimelineView,
     MessageCreateView,
     MessageEditView,
     MessageDeleteView,
     CommentCreateView,
+    CommentApiView,
     GroupView,
     GroupMembersView,
     GroupNewsView,
     UserDirectoryView,
+    UserSuggestView,
+    UserDirectoryExportView,
+    GroupMembersExportView,
     GroupDirectoryView,
 )
-from .feeds import LatestEntriesFeed
+from .feeds import (
+    LatestEntriesFeed,
+    LatestEntriesAtomFeed,
+    GroupEntriesFeed,
+    GroupEntriesAtomFeed,
+)
+from .caching import news_etag, news_last_modified
+from .routers import read_from_replica, pin_to_primary
+
+staff_required = user_passes_test(lambda user: user.is_staff)
+
+feed_view = condition(
+    etag_func=news_etag,
+    last_modified_func=news_last_modified,
+)
 
 urlpatterns = [
     # Message List (homepage)
     url(
         r'^$',
-        MessageListView.as_view(),
+        condition(etag_func=news_etag)(
+            read_from_replica(MessageListView.as_view())
+        ),
         name='index',
     ),
+    url(
+        r'^mine$',
+        login_required(TimelineView.as_view()),
+        name='newsfeed-mine',
+    ),
     # Message
     url(
         r'^add$',
-        login_required(MessageCreateView.as_view()),
+        login_required(pin_to_primary(MessageCreateView.as_view())),
         name="newsfeed-add",
     ),
     url(
         r'^edit/(?P<pk>[0-9]+)/$',
-        login_required(MessageEditView.as_view()),
+        login_required(pin_to_primary(MessageEditView.as_view())),
         name="newsfeed-edit",
     ),
     url(
         r'^delete/(?P<pk>[0-9]+)/$',
-        login_required(MessageDeleteView.as_view()),
+        login_required(pin_to_primary(MessageDeleteView.as_view())),
         name="newsfeed-delete",
     ),
     url(
         r'^comment/(?P<on_message>[0-9]+)/$',
-        login_required(CommentCreateView.as_view()),
+        login_required(pin_to_primary(CommentCreateView.as_view())),
         name="comment-add"
     ),
+    url(
+        r'^comments/$',
+        login_required(pin_to_primary(CommentApiView.as_view())),
+        name="comment-api"
+    ),
 
     # User Directory
     url(
         r'^directory/$',
-        login_required(UserDirectoryView.as_view()),
+        login_required(read_from_replica(UserDirectoryView.as_view())),
         name='directory',
     ),
+    url(
+        r'^directory/suggest$',
+        login_required(UserSuggestView.as_view()),
+        name='directory-suggest',
+    ),
+    url(
+        r'^directory/export\.(?P<format>csv|vcf)$',
+        login_required(staff_required(UserDirectoryExportView.as_view())),
+        name='directory-export',
+    ),
 
     # Group Directory
     url(
         r'^groups/$',
-        login_required(GroupDirectoryView.as_view()),
+        login_required(read_from_replica(GroupDirectoryView.as_view())),
         name='groups',
     ),
 
@@ -68,21 +110,45 @@ urlpatterns = [
     # Group Members
     url(
         r'^(?P<slug>[\w-]+)/members$',
-        login_required(GroupMembersView.as_view()),
+        login_required(read_from_replica(GroupMembersView.as_view())),
         name="workgroup-members",
     ),
+    url(
+        r'^(?P<slug>[\w-]+)/members\.(?P<format>csv|vcf)$',
+        login_required(staff_required(GroupMembersExportView.as_view())),
+        name="workgroup-members-export",
+    ),
 
     # Group News
     url(
         r'^(?P<slug>[\w-]+)/news$',
-        login_required(GroupNewsView.as_view()),
+        login_required(
+            condition(etag_func=news_etag)(
+                read_from_replica(GroupNewsView.as_view())
+            )
+        ),
         name="workgroup-news",
     ),
 
     # Feeds
     url(
         r'^feeds/latest$',
-        login_required(LatestEntriesFeed()),
+        login_required(feed_view(read_from_replica(LatestEntriesFeed()))),
         name="feed-latest",
     ),
+    url(
+        r'^feeds/latest/atom$',
+        login_required(feed_view(read_from_replica(LatestEntriesAtomFeed()))),
+        name="feed-latest-atom",
+    ),
+    url(
+        r'^(?P<slug>[\w-]+)/feed$',
+        login_required(feed_view(read_from_replica(GroupEntriesFeed()))),
+        name="workgroup-feed",
+    ),
+    url(
+        r'^(?P<slug>[\w-]+)/feed/atom$',
+        login_required(feed_view(read_from_replica(GroupEntriesAtomFeed()))),
+        name="workgroup-feed-atom",
+    ),
 ]
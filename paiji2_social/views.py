@@ -1,31 +1,158 @@
 # -*- encoding: utf-8 -*-
+import json
+
 from django.shortcuts import get_object_or_404
 from django.views import generic
 from django.core.urlresolvers import reverse
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 from django.contrib import messages
-from django.http import HttpResponseNotFound
+from django.http import (
+    HttpResponseNotFound, HttpResponseRedirect, JsonResponse, Http404,
+    StreamingHttpResponse,
+)
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 
-from .models import Message, Comment, Group
+from .models import Message, Comment, Group, Bureau, Post
 from .forms import CommentForm, MessageForm
+from .pagination import cursor_paginate
+from .caching import (
+    news_feed_cache_key, get_news_cache_timeout, bump_news_marker,
+)
+from .search import get_search_backend
+from .suggest import get_prefix_index
+from . import timeline, writebehind, exports
+from .membership import get_group_ids
 from django.conf import settings
 
 
-class MessageListView(generic.ListView):
+class CommentAreaMixin(object):
+    """ Loads the comments of the displayed messages in a single query """
+
+    # given to display_comment_area by news-feed.html
+    comments_per_message = 20
+
+    def get_context_data(self, **kwargs):
+        context = super(CommentAreaMixin, self).get_context_data(**kwargs)
+        Comment.objects.attach_to(
+            context['object_list'],
+            self.comments_per_message,
+        )
+        context['comments_per_message'] = self.comments_per_message
+        return context
+
+
+class NewsFeedMixin(object):
+    """
+    Lists the newest messages first, or the recently commented ones with
+    ``?sort=active``.
+
+    Keeps the offset pagination for ``?page=`` URLs and switches to the
+    cursor pagination for ``?before=``/``?after=`` URLs, or by default
+    when PAIJI2_SOCIAL_CURSOR_PAGINATION is set.
+    """
+
+    def sort_by_activity(self):
+        return self.request.GET.get('sort') == 'active'
+
+    def sort_news(self, queryset):
+        if self.sort_by_activity():
+            return queryset.order_by('-lastActivity', '-id')
+        return queryset
+
+    def use_cursor_pagination(self):
+        params = self.request.GET
+        if self.sort_by_activity():
+            # the cursors follow the publication date
+            return False
+        if 'before' in params or 'after' in params:
+            return True
+        return (
+            getattr(settings, 'PAIJI2_SOCIAL_CURSOR_PAGINATION', False) and
+            self.page_kwarg not in params
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super(NewsFeedMixin, self).paginate_queryset(
+                queryset,
+                page_size,
+            )
+        page = cursor_paginate(
+            queryset,
+            page_size,
+            before=self.request.GET.get('before'),
+            after=self.request.GET.get('after'),
+        )
+        return (None, page, page.object_list, page.has_other_pages())
+
+
+class MessageListView(
+                      NewsFeedMixin,
+                      CommentAreaMixin,
+                      generic.ListView
+                     ):
     model = Message
     paginate_by = 5
     context_object_name = 'news'
     template_name = 'social/index.html'
 
     def get_queryset(self):
-        qs = super(MessageListView, self).get_queryset()
-        if not self.request.user.is_authenticated():
-            qs = qs.filter(public=True)
+        return self.sort_news(
+            Message.objects.visible_to(self.request.user).for_feed()
+        )
+
+    def get(self, request, *args, **kwargs):
+        """
+        The news feed is the same for every visitor, so its rendering is
+        cached until a message or a comment changes. Pages of authenticated
+        users hold their CSRF token and edit links and are not shared.
+        """
+        if request.user.is_authenticated():
+            return super(MessageListView, self).get(request, *args, **kwargs)
+
+        # lazy, the template names are read from it on both branches
+        self.object_list = self.get_queryset()
+        key = news_feed_cache_key(request)
+        news_feed = cache.get(key)
+        if news_feed is None:
+            news_feed = render_to_string(
+                'social/news-feed.html',
+                self.get_context_data(),
+                request=request,
+            )
+            cache.set(key, news_feed, get_news_cache_timeout())
+
+        return self.render_to_response({
+            'view': self,
+            'news_feed': mark_safe(news_feed),
+        })
+
 
-        return qs.order_by('-pubDate').select_related('author')
+class TimelineView(CommentAreaMixin, generic.ListView):
+    """ News of the groups of the user, read from their timeline """
+    model = Message
+    paginate_by = 5
+    context_object_name = 'news'
+    template_name = 'social/timeline.html'
+
+    def dispatch(self, *args, **kwargs):
+        if not timeline.is_enabled():
+            raise Http404
+        return super(TimelineView, self).dispatch(*args, **kwargs)
+
+    def get_queryset(self):
+        return Message.objects.filter(
+            timeline_entries__user=self.request.user,
+        ).for_feed().order_by(
+            '-timeline_entries__pubDate',
+            '-timeline_entries__message',
+        )
 
 
 class MessageFormMixin(object):
@@ -36,8 +163,8 @@ class MessageFormMixin(object):
         kwargs = super(MessageFormMixin, self).get_form_kwargs()
         kwargs.update({
             'groups': Group.objects.filter(
-                bureaus__members__utilisateur=self.request.user,
-                )
+                pk__in=get_group_ids(self.request.user, self.request),
+            )
         })
         return kwargs
 
@@ -47,22 +174,53 @@ class MessageCreateView(MessageFormMixin, generic.CreateView):
     template_name = 'social/message_form.html'
 
     def form_valid(self, form):
+        if writebehind.is_enabled():
+            writebehind.enqueue_message(
+                self.request.user,
+                form.cleaned_data['group'],
+                form.cleaned_data['title'],
+                form.cleaned_data['content'],
+                form.cleaned_data['public'],
+                timezone.now(),
+            )
+            return HttpResponseRedirect(self.get_success_url())
         form.instance.author = self.request.user
         return super(MessageCreateView, self).form_valid(form)
 
     def get_success_url(self):
-        messages.success(
-            self.request,
-            _('Your request has been saved successfully :P'),
-        )
+        if writebehind.is_enabled():
+            message = _(
+                'Your message has been received, '
+                'it will be published in a moment'
+            )
+        else:
+            message = _('Your request has been saved successfully :P')
+        messages.success(self.request, message)
         return reverse('index')
 
 
 class OwnershipMessageCheck(object):
+    """
+    Making sure that only authors can update Messages: the message is
+    looked up among the ones of the user, once per request.
+    """
+
+    def get_queryset(self):
+        return super(OwnershipMessageCheck, self).get_queryset().filter(
+            author=self.request.user,
+        )
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super(OwnershipMessageCheck, self).get_object(queryset)
+        if not hasattr(self, '_object'):
+            self._object = super(OwnershipMessageCheck, self).get_object()
+        return self._object
+
     def dispatch(self, request, *args, **kwargs):
-        """ Making sure that only authors can update Messages """
-        obj = self.get_object()
-        if obj.author != self.request.user:
+        try:
+            self.get_object()
+        except Http404:
             return HttpResponseNotFound(
                 _('Rezo is not hacked. You don\'t have the permission xD')
             )
@@ -112,9 +270,15 @@ class CommentCreateView(generic.CreateView):
     http_method_names = ['post']
 
     def form_valid(self, form):
-        # TODO: it should check that the message exists before
-        #       showing the form
-        message = Message.objects.get(id=self.kwargs['on_message'])
+        message = get_object_or_404(Message, id=self.kwargs['on_message'])
+        if writebehind.is_enabled():
+            writebehind.enqueue_comment(
+                self.request.user,
+                message,
+                form.cleaned_data['content'],
+                timezone.now(),
+            )
+            return HttpResponseRedirect(self.get_success_url())
         form.instance.author = self.request.user
         form.instance.message = message
         # TODO use auto_now_add=True
@@ -122,14 +286,102 @@ class CommentCreateView(generic.CreateView):
         return super(CommentCreateView, self).form_valid(form)
 
     def get_success_url(self):
-        messages.success(
-            self.request,
-            _("Your comment has been successfully saved."),
-        )
+        if writebehind.is_enabled():
+            message = _(
+                'Your comment has been received, '
+                'it will be published in a moment'
+            )
+        else:
+            message = _("Your comment has been successfully saved.")
+        messages.success(self.request, message)
         success_url = self.request.POST.get('next')
         return success_url if success_url != '' else reverse('index')
 
 
+class CommentApiView(generic.View):
+    """
+    Saves the comments posted as JSON, a ``{"message": id, "content": ...}``
+    object or a list of them, and answers the rendered comments so the
+    page can show them without being reloaded. With write-behind, the
+    comments are queued and the answer is a 202.
+    """
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body.decode(request.encoding or 'utf-8'))
+        except ValueError:
+            return JsonResponse({'errors': _('Invalid JSON.')}, status=400)
+        batch = isinstance(data, list)
+        items = data if batch else [data]
+        max_batch = getattr(settings, 'PAIJI2_SOCIAL_COMMENT_BATCH_SIZE', 20)
+        if not items or len(items) > max_batch:
+            return JsonResponse({
+                'errors': _('Send between 1 and %d comments.') % max_batch,
+            }, status=400)
+
+        now = timezone.now()
+        comments, errors = [], {}
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors[i] = _('A comment is an object.')
+                continue
+            form = CommentForm({'content': item.get('content')})
+            if not form.is_valid():
+                errors[i] = dict(
+                    (field, [unicode(error) for error in field_errors])
+                    for field, field_errors in form.errors.items()
+                )
+                continue
+            try:
+                message_id = int(item.get('message'))
+            except (TypeError, ValueError):
+                errors[i] = {'message': [_('Unknown message.')]}
+                continue
+            form.instance.author = request.user
+            form.instance.message_id = message_id
+            form.instance.pubDate = now
+            comments.append(form.instance)
+        if errors:
+            return JsonResponse({'errors': errors}, status=400)
+
+        counts = {}
+        for comment in comments:
+            counts[comment.message_id] = counts.get(comment.message_id, 0) + 1
+        found = Message.objects.visible_to(request.user).filter(
+            pk__in=counts,
+        ).values_list('pk', flat=True)
+        if len(found) != len(counts):
+            return JsonResponse({'errors': _('Unknown message.')}, status=404)
+
+        if writebehind.is_enabled():
+            writebehind.enqueue_comments(comments)
+            status = 202
+        else:
+            self.save_comments(comments, counts, now)
+            status = 201
+
+        rendered = [{
+            'message': comment.message_id,
+            'html': render_to_string(
+                'social/comment.html',
+                {'comment': comment},
+                request=request,
+            ),
+        } for comment in comments]
+        return JsonResponse(rendered if batch else rendered[0],
+                            safe=False, status=status)
+
+    def save_comments(self, comments, counts, now):
+        # bulk_create sends no signal, the receivers' work is done here
+        with transaction.atomic():
+            Comment.objects.bulk_create(comments)
+            for message_id, nb in counts.items():
+                Message.objects.filter(pk=message_id).add_comments(nb, now)
+        # once committed, or the feed could be cached again without them
+        bump_news_marker()
+
+
 class GroupView(generic.DetailView):
     model = Group
     template_name = 'social/group_detail.html'
@@ -147,32 +399,38 @@ class GroupMixin(object):
         return cd
 
 
-class GroupNewsView(GroupMixin, generic.ListView):
+class GroupNewsView(
+                    GroupMixin,
+                    NewsFeedMixin,
+                    CommentAreaMixin,
+                    generic.ListView
+                   ):
     model = Message
     template_name = 'social/news_list.html'
     context_object_name = 'news'
     paginate_by = 8
 
     def get_queryset(self):
-        qs = super(GroupNewsView, self).get_queryset()
-        qs = qs.filter(group=self.group)
-        qs = qs.order_by(
-            '-pubDate'
-        ).select_related(
-            'author'
+        return self.sort_news(
+            Message.objects.filter(group=self.group).for_feed()
         )
-        return qs
 
 
 class GroupMembersView(GroupMixin, generic.ListView):
-    model = get_user_model()
+    model = Bureau
     template_name = 'social/member_list.html'
-    context_object_name = 'members'
+    context_object_name = 'bureaus'
 
     def get_queryset(self):
-        qs = super(GroupMembersView, self).get_queryset()
-        qs = qs.filter(posts__bureau__group=self.group)
-        return qs
+        """ The bureaus of the group with their posts, in two queries """
+        return Bureau.objects.filter(
+            group=self.group,
+        ).order_by(
+            '-createdDate',
+        ).prefetch_related(Prefetch(
+            'members',
+            queryset=Post.objects.select_related('utilisateur', 'postType'),
+        ))
 
 
 class UserDirectoryView(generic.ListView):
@@ -183,30 +441,8 @@ class UserDirectoryView(generic.ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        if 'q' in self.request.GET:
-            query = self.request.GET['q']
-            words = query.split(' ')
-            Qobj = Q()
-            filtered = False
-            for word in words:
-                if word != '':
-                    filtered = True
-                    Qobj &= (
-                        Q(first_name__icontains=word) |
-                        Q(last_name__icontains=word) |
-                        Q(username__icontains=word) |
-                        Q(email__icontains=word)
-                    )
-                    if (
-                        hasattr(settings, 'CI_TEST') and
-                        settings.CI_TEST
-                    ):
-                        pass
-                    else:
-                        Qobj |= Q(room__icontains=word)
-            if filtered:
-                return self.model.objects.filter(Qobj)
-        return super(UserDirectoryView, self).get_queryset()
+        qs = super(UserDirectoryView, self).get_queryset()
+        return get_search_backend().search(qs, self.request.GET.get('q', ''))
 
     def get_context_data(self, **kwargs):
         context = super(UserDirectoryView, self).get_context_data(**kwargs)
@@ -215,8 +451,112 @@ class UserDirectoryView(generic.ListView):
         return context
 
 
+class ExportMixin(object):
+    """
+    Streams the rows of get_rows() as CSV or vCards: the response starts
+    with the first rows, read by chunks (see exports.iterate_in_chunks).
+    """
+    columns = (
+        ('username', _('Username')),
+        ('first_name', _('First name')),
+        ('last_name', _('Last name')),
+        ('email', _('Email')),
+    )
+    title_field = None
+
+    def get(self, request, *args, **kwargs):
+        rows = self.get_rows()
+        if kwargs['format'] == 'vcf':
+            content = exports.vcards(rows, self.title_field)
+            content_type = 'text/vcard; charset=utf-8'
+        else:
+            content = exports.csv_lines(rows, self.columns)
+            content_type = 'text/csv; charset=utf-8'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+            self.get_filename(),
+            kwargs['format'],
+        )
+        return response
+
+
+class UserDirectoryExportView(ExportMixin, generic.View):
+
+    def get_filename(self):
+        return 'directory'
+
+    def get_rows(self):
+        users = get_search_backend().search(
+            get_user_model().objects.all(),
+            self.request.GET.get('q', ''),
+        )
+        return exports.iterate_in_chunks(
+            users,
+            ('username', 'first_name', 'last_name', 'email'),
+        )
+
+
+class GroupMembersExportView(GroupMixin, ExportMixin, generic.View):
+    """ The members of the current bureau of the group """
+    columns = ExportMixin.columns + (
+        ('post', _('Post')),
+        ('description', _('Description')),
+    )
+    title_field = 'post'
+
+    def get_filename(self):
+        return '%s-members' % self.group.slug
+
+    def get_rows(self):
+        posts = Post.objects.filter(
+            bureau__group=self.group,
+            bureau__endDate=None,
+        )
+        rows = exports.iterate_in_chunks(posts, (
+            'utilisateur__username',
+            'utilisateur__first_name',
+            'utilisateur__last_name',
+            'utilisateur__email',
+            'postType__description',
+            'description',
+        ))
+        for row in rows:
+            yield {
+                'username': row['utilisateur__username'],
+                'first_name': row['utilisateur__first_name'],
+                'last_name': row['utilisateur__last_name'],
+                'email': row['utilisateur__email'],
+                'post': row['postType__description'],
+                'description': row['description'],
+            }
+
+
+class UserSuggestView(generic.View):
+    """ Type-ahead of the user directory, answered from memory """
+    limit = 10
+
+    def get(self, request, *args, **kwargs):
+        suggestions = get_prefix_index().suggest(
+            request.GET.get('q', ''),
+            self.limit,
+        )
+        return JsonResponse([
+            {'username': username, 'name': name}
+            for username, name in suggestions
+        ], safe=False)
+
+
 class GroupDirectoryView(generic.ListView):
     model = Group
     context_object_name = 'groups'
-    ordering = ['name', 'category', 'createdOn']
     template_name = 'social/groups.html'
+    paginate_by = 48
+
+    def get_queryset(self):
+        # ordered by category for the template to regroup them
+        return Group.objects.select_related(
+            'category',
+        ).order_by(
+            'category__name',
+            'name',
+        )
@@ -0,0 +1,125 @@
+# -*- encoding: utf-8 -*-
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import Message, Comment, Group, PendingWrite, TimelineEntry
+from . import timeline
+
+
+def is_enabled():
+    return getattr(settings, 'PAIJI2_SOCIAL_WRITE_BEHIND', False)
+
+
+def enqueue_message(author, group, title, content, public, pubDate):
+    PendingWrite.objects.create(
+        kind=PendingWrite.MESSAGE,
+        author=author,
+        payload=json.dumps({
+            'group': group.pk,
+            'title': title,
+            'content': content,
+            'public': public,
+            'pubDate': pubDate,
+        }, cls=DjangoJSONEncoder),
+    )
+
+
+def get_comment_write(author, message_id, content, pubDate):
+    return PendingWrite(
+        kind=PendingWrite.COMMENT,
+        author=author,
+        payload=json.dumps({
+            'message': message_id,
+            'content': content,
+            'pubDate': pubDate,
+        }, cls=DjangoJSONEncoder),
+    )
+
+
+def enqueue_comment(author, message, content, pubDate):
+    get_comment_write(author, message.pk, content, pubDate).save()
+
+
+def enqueue_comments(comments):
+    """ Queues unsaved comments, in a single insert """
+    PendingWrite.objects.bulk_create([
+        get_comment_write(
+            comment.author,
+            comment.message_id,
+            comment.content,
+            comment.pubDate,
+        ) for comment in comments
+    ])
+
+
+def apply_writes(writes):
+    """
+    Saves the messages and the comments one by one, so the post_save
+    receivers run as usual. Those of deleted groups or messages are
+    dropped.
+    """
+    values = [(write, json.loads(write.payload)) for write in writes]
+    group_ids = set(Group.objects.filter(pk__in=[
+        payload['group'] for write, payload in values
+        if write.kind == PendingWrite.MESSAGE
+    ]).values_list('pk', flat=True))
+    message_ids = set(Message.objects.filter(pk__in=[
+        payload['message'] for write, payload in values
+        if write.kind == PendingWrite.COMMENT
+    ]).values_list('pk', flat=True))
+
+    nb_saved = 0
+    for write, payload in values:
+        if write.kind == PendingWrite.MESSAGE:
+            if payload['group'] not in group_ids:
+                continue
+            pubDate = parse_datetime(payload['pubDate'])
+            message = Message.objects.create(
+                author_id=write.author_id,
+                group_id=payload['group'],
+                title=payload['title'],
+                content=payload['content'],
+                public=payload['public'],
+                lastActivity=pubDate,
+            )
+            # pubDate is set by auto_now_add on insert, it is restored to
+            # the time the message was submitted
+            Message.objects.filter(pk=message.pk).update(pubDate=pubDate)
+            if timeline.is_enabled():
+                TimelineEntry.objects.filter(message=message).update(
+                    pubDate=pubDate,
+                )
+        else:
+            if payload['message'] not in message_ids:
+                continue
+            Comment.objects.create(
+                author_id=write.author_id,
+                message_id=payload['message'],
+                content=payload['content'],
+                pubDate=parse_datetime(payload['pubDate']),
+            )
+        nb_saved += 1
+    return nb_saved
+
+
+def drain(batch_size=100):
+    """
+    Saves the pending writes, oldest first, a transaction per batch.
+    Returns the number of messages and comments saved.
+    """
+    nb_saved = 0
+    while True:
+        with transaction.atomic():
+            writes = list(
+                PendingWrite.objects.select_for_update()[:batch_size]
+            )
+            if not writes:
+                return nb_saved
+            nb_saved += apply_writes(writes)
+            PendingWrite.objects.filter(
+                pk__in=[write.pk for write in writes],
+            ).delete()